@@ -2,29 +2,84 @@ import os
 import uuid
 import json
 import re
-import pandas as pd
 from datetime import datetime
-from flask import Flask, render_template, request, jsonify, send_file, url_for, redirect
-from werkzeug.utils import secure_filename
-from PIL import Image
+from flask import Flask, Request, render_template, request, jsonify, send_file, send_from_directory, url_for, redirect, Response, stream_with_context, session
+from openpyxl import Workbook
 import io
 import base64
-import requests
+import hashlib
 import logging
+import time
+import queue
+import threading
+import zipfile
+import csv
+import tempfile
+from datetime import timedelta
+from urllib.parse import quote, urlsplit
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from cache import DiskCache, sentence_cache_key
+import http_client
+from jobs import JobStore
+from pipeline import StagedPipeline
+from limiter import LimiterRegistry, request_with_retry
+from result_store import ResultStore, COLUMNS as RESULT_COLUMNS
+from monthly_report import MonthlyReport
+from segmenter import split_sentences, pack_chunks
+from triage import classify, SKIP as TRIAGE_SKIP, FULL as TRIAGE_FULL
+from known_errors import KnownErrorDictionary, extract_pairs
+from image_prep import prepare_image
+from reply_parser import strip_code_fence, build_check_result, parse_check_reply
+from upload_store import UploadStore, Sweeper, purge_expired_files
+from config_store import ConfigStore, chat_template
+from logging_setup import setup_logging, sample_body
+from metrics import Metrics
+from tracing import Trace, SlowTraceStore, span, propagate
+
+class _Request(Request):
+    """批量上传的请求体包含多张图片，使用单独的大小上限；单张图片仍受 MAX_CONTENT_LENGTH 限制"""
+
+    @property
+    def max_content_length(self):
+        if self.endpoint == 'bulk_upload':
+            return app.config['BULK_MAX_CONTENT_LENGTH']
+        return super().max_content_length
 
 app = Flask(__name__)
+app.request_class = _Request
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY') or 'hard-to-guess-string'
 app.config['UPLOAD_FOLDER'] = 'static/uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 限制上传文件大小为16MB
+app.config['DATA_FOLDER'] = os.environ.get('DATA_FOLDER') or 'data'  # SQLite数据文件目录
+app.config['SENTENCE_CACHE_TTL'] = 30 * 24 * 3600  # 句子检查结果缓存有效期（秒）
+app.config['SENTENCE_CACHE_MAX_ENTRIES'] = 200000  # 句子检查结果缓存最大条目数
+app.config['OCR_CACHE_TTL'] = 30 * 24 * 3600  # OCR识别结果缓存有效期（秒）
+app.config['OCR_CACHE_MAX_ENTRIES'] = 50000  # OCR识别结果缓存最大条目数
+app.config['KNOWN_ERROR_MIN_HITS'] = 2  # 同一修改被模型确认多少次后加入错别字词典
+app.config['UPLOAD_TTL'] = 7 * 24 * 3600  # 上传图片最后一次访问后的保留时间（秒）
+app.config['UPLOAD_QUOTA'] = 2 * 1024 ** 3  # 上传目录的总字节数上限
+app.config['EXPORT_FOLDER'] = os.path.join(app.config['DATA_FOLDER'], 'exports')  # 导出文件目录
+app.config['EXPORT_TTL'] = 24 * 3600  # 导出文件保留时间（秒）
+app.config['STORAGE_SWEEP_INTERVAL'] = 600  # 后台清理上传和导出目录的间隔（秒）
+app.config['JOB_TTL'] = 24 * 3600  # 后台任务记录保留时间（秒）
+app.config['BULK_MAX_FILES'] = 500  # 批量上传单次最多接收的图片数
+app.config['BULK_MAX_CONTENT_LENGTH'] = 512 * 1024 * 1024  # 批量上传单次请求的大小上限
+app.config['BULK_MAX_UNZIPPED_SIZE'] = 512 * 1024 * 1024  # zip包解压后的总大小上限
+app.config['IMAGE_EXTENSIONS'] = {'.png', '.jpg', '.jpeg', '.bmp', '.gif', '.webp', '.tif', '.tiff'}
+app.config['TRACE_KEEP'] = 50  # 保存耗时最长的多少次 /process 请求的追踪结果
+app.config['LOG_FILE'] = 'app.log'  # 日志文件
+app.config['LOG_MAX_BYTES'] = 10 * 1024 * 1024  # 日志文件达到该大小后轮转
+app.config['LOG_BACKUP_COUNT'] = 5  # 保留的历史日志文件数
+app.config['LOG_JSON'] = True  # 日志文件每条记录写为一行JSON
+app.config['LOG_ORPHAN_TTL'] = 24 * 3600  # 已退出worker进程的日志文件保留多少秒
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),  # 输出到控制台
-        logging.FileHandler('app.log', encoding='utf-8')  # 同时输出到文件
-    ]
+# 配置日志：记录放入队列后由后台线程写控制台和文件，不阻塞请求
+setup_logging(
+    app.config['LOG_FILE'],
+    max_bytes=app.config['LOG_MAX_BYTES'],
+    backup_count=app.config['LOG_BACKUP_COUNT'],
+    json_lines=app.config['LOG_JSON'],
+    orphan_ttl=app.config['LOG_ORPHAN_TTL']
 )
 logger = logging.getLogger(__name__)
 
@@ -33,30 +88,127 @@ logger = logging.getLogger(__name__)
 def inject_now():
     return {'now': datetime.now()}
 
-# 确保上传目录存在
+# 确保上传目录和导出目录存在
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+os.makedirs(app.config['EXPORT_FOLDER'], exist_ok=True)
+
+# 句子检查结果缓存，所有worker进程共享
+sentence_cache = DiskCache(
+    os.path.join(app.config['DATA_FOLDER'], 'cache.db'),
+    'sentence',
+    ttl=app.config['SENTENCE_CACHE_TTL'],
+    max_entries=app.config['SENTENCE_CACHE_MAX_ENTRIES']
+)
+
+# OCR识别结果缓存，按图片内容的SHA-256索引
+ocr_cache = DiskCache(
+    os.path.join(app.config['DATA_FOLDER'], 'cache.db'),
+    'ocr',
+    ttl=app.config['OCR_CACHE_TTL'],
+    max_entries=app.config['OCR_CACHE_MAX_ENTRIES']
+)
+
+# 从模型确认过的修改中学习的错别字词典，命中时无需请求API
+known_errors = KnownErrorDictionary(
+    os.path.join(app.config['DATA_FOLDER'], 'known_errors.db'),
+    min_hits=app.config['KNOWN_ERROR_MIN_HITS']
+)
+
+# 上传图片按内容哈希保存，相同图片只存一份；过期和超出配额的文件由后台定期清理
+upload_store = UploadStore(
+    app.config['UPLOAD_FOLDER'],
+    os.path.join(app.config['DATA_FOLDER'], 'uploads.db'),
+    ttl=app.config['UPLOAD_TTL'],
+    quota=app.config['UPLOAD_QUOTA']
+)
+storage_sweeper = Sweeper(upload_store, app.config['STORAGE_SWEEP_INTERVAL'], [
+    upload_store.sweep,
+    lambda: purge_expired_files(app.config['EXPORT_FOLDER'], app.config['EXPORT_TTL'])
+])
+
+# 后台处理任务：状态存储在SQLite中，任务由本进程的分阶段流水线执行
+job_store = JobStore(os.path.join(app.config['DATA_FOLDER'], 'jobs.db'), ttl=app.config['JOB_TTL'])
+
+# 默认配置，config.json 不存在时写入
+DEFAULT_CONFIG = {
+    'api_url': '',
+    'api2_url': 'https://api.deepseek.com/chat/completions',
+    'api_key': '',
+    'model': 'deepseek-chat',
+    'system_prompt': '作为一个细致耐心的文字秘书，对下面的句子进行错别字检查',
+    'kimi_api_key': '',  # Kimi API密钥
+    'kimi_upload_url': 'https://api.moonshot.cn/v1/files',  # Kimi文件上传API的URL
+    'check_concurrency': 8,  # 文字检查API的最大并发请求数
+    'check_batch_size': 10,  # 每个文字检查请求打包的句子数，1表示逐句检查
+    'check_batch_chars': 2000,  # 每个文字检查请求打包的最大字数
+    'triage_enabled': True,  # 本地分级，跳过页码、编号等不需要检查的句子
+    'cheap_model': '',  # 简单句使用的模型，为空时与model相同
+    'known_errors_enabled': True,  # 每句先查错别字词典并立即标记；跳过的句子和简单句命中时不再请求API
+    'image_preprocess': True,  # 上传OCR前压缩图片
+    'image_max_side': 2048,  # 压缩后图片的最长边（像素）
+    'image_max_bytes': 1536 * 1024,  # 压缩后图片的字节预算
+    'image_grayscale': True,  # 压缩时转为灰度
+    'http_pool_size': 32,  # 每个上游主机的HTTP连接池大小
+    'http2': False,  # 是否启用HTTP/2（需安装 httpx[http2]）
+    'ocr_concurrency': 2,  # 后台任务OCR阶段的并发图片数
+    'check_stage_concurrency': 2,  # 后台任务检查阶段的并发图片数
+    'pipeline_queue_size': 4,  # OCR完成、等待检查的图片数上限
+    'upstream_initial_concurrency': 8,  # 每个上游API的初始并发上限
+    'upstream_max_concurrency': 64,  # 每个上游API的最大并发上限
+    'upstream_latency_slo': 15,  # 耗时超过该秒数的请求不再提高并发上限
+    'upstream_max_retries': 3,  # 遇到429、5xx或网络异常时的最大重试次数
+    'log_body_sample_rate': 0.01,  # 记录文字检查请求体和响应体的比例，失败的请求总是记录
+    'log_body_max_chars': 2000  # 日志中请求体和响应体的最大字数
+}
+
+# 配置保存在内存中，config.json 修改后自动重新加载
+config_store = ConfigStore('config.json', DEFAULT_CONFIG)
 
 # 加载配置
 def load_config():
-    try:
-        with open('config.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        default_config = {
-            'api_url': '',
-            'api2_url': 'https://api.deepseek.com/chat/completions',
-            'api_key': '',
-            'model': 'deepseek-chat',
-            'system_prompt': '作为一个细致耐心的文字秘书，对下面的句子进行错别字检查',
-            'kimi_api_key': '',  # Kimi API密钥
-            'kimi_upload_url': 'https://api.moonshot.cn/v1/files'  # Kimi文件上传API的URL
-        }
-        with open('config.json', 'w', encoding='utf-8') as f:
-            json.dump(default_config, f, ensure_ascii=False, indent=2)
-        return default_config
+    return config_store.get()
+
+# 初始化共享HTTP连接池并预热到上游API的连接
+_startup_config = load_config()
+http_client.configure(
+    pool_maxsize=_startup_config.get('http_pool_size', 32),
+    http2=_startup_config.get('http2', False)
+)
+http_client.warm_up([_startup_config.get('api2_url'), _startup_config.get('kimi_upload_url')])
 
-# 全局保存处理结果数据
-results_data = []
+# 上游API自适应并发限制，状态在所有worker进程之间共享
+upstream_limiters = LimiterRegistry(
+    os.path.join(app.config['DATA_FOLDER'], 'limiter.db'),
+    initial_limit=int(_startup_config.get('upstream_initial_concurrency', 8)),
+    max_limit=int(_startup_config.get('upstream_max_concurrency', 64)),
+    latency_slo=float(_startup_config.get('upstream_latency_slo', 15))
+)
+
+# 处理结果存储，所有worker进程共享，按浏览器会话和批次区分
+result_store = ResultStore(os.path.join(app.config['DATA_FOLDER'], 'results.db'))
+
+# 月度巡检报表，结果写入后在后台增量刷新
+monthly_report = MonthlyReport(result_store, os.path.join(app.config['DATA_FOLDER'], 'reports'))
+
+# 耗时最长的 /process 请求的追踪结果
+trace_store = SlowTraceStore(os.path.join(app.config['DATA_FOLDER'], 'traces.db'), keep=app.config['TRACE_KEEP'])
+
+# 运行指标，各worker进程定期写入SQLite，由 /metrics 汇总输出
+metrics = Metrics(os.path.join(app.config['DATA_FOLDER'], 'metrics.db'), prefix='inspection_')
+metrics.histogram('upstream_request_seconds', '上游API请求耗时（含重试），stage区分Kimi上传、Kimi内容获取和DeepSeek检查')
+metrics.histogram('process_seconds', '单张图片从OCR到检查完成的耗时，mode区分同步、流式和后台任务')
+metrics.histogram('sentences_per_image', '每张图片切分出的句子数', buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500))
+metrics.counter('upstream_responses_total', '上游API每次请求的响应状态码（网络异常记为error）')
+metrics.gauge('upstream_in_flight', '正在进行的上游API请求数')
+metrics.gauge('process_in_flight', '正在同步或流式处理的图片数')
+metrics.gauge('pipeline_queue_depth', '后台任务流水线各阶段的排队数')
+metrics.gauge('pipeline_active', '后台任务流水线各阶段正在处理的任务数')
+
+def _current_session_id():
+    """当前浏览器会话的ID，用于区分不同用户的处理结果"""
+    if 'session_id' not in session:
+        session['session_id'] = uuid.uuid4().hex
+    return session['session_id']
 
 @app.route('/')
 def index():
@@ -66,16 +218,17 @@ def index():
 @app.route('/config', methods=['GET', 'POST'])
 def config():
     if request.method == 'POST':
-        new_config = {
+        # 保留表单之外的配置项（如并发数）
+        new_config = load_config()
+        new_config.update({
             'api2_url': request.form.get('api2_url', 'https://api.deepseek.com/chat/completions'),
             'api_key': request.form.get('api_key', ''),
             'model': request.form.get('model', 'deepseek-chat'),
             'system_prompt': request.form.get('system_prompt', '作为一个细致耐心的文字秘书，对下面的句子进行错别字检查'),
             'kimi_api_key': request.form.get('kimi_api_key', ''),
             'kimi_upload_url': request.form.get('kimi_upload_url', 'https://api.moonshot.cn/v1/files')
-        }
-        with open('config.json', 'w', encoding='utf-8') as f:
-            json.dump(new_config, f, ensure_ascii=False, indent=2)
+        })
+        config_store.save(new_config)
         return redirect(url_for('index'))
     
     config = load_config()
@@ -91,14 +244,8 @@ def upload_file():
         return jsonify({'success': False, 'message': '没有选择文件'})
     
     if file:
-        # 生成唯一文件名
-        filename = f"temp_{uuid.uuid4().hex[:8]}_{int(datetime.now().timestamp())}"
-        ext = os.path.splitext(file.filename)[1]
-        full_filename = secure_filename(filename + ext)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], full_filename)
-        
-        # 保存文件
-        file.save(filepath)
+        # 按内容哈希保存文件，相同内容只保存一份
+        image_hash, filepath = _store_upload(file.stream, _safe_extension(file.filename))
         
         # 确保返回的路径使用正斜杠
         normalized_filepath = filepath.replace('\\', '/')
@@ -106,15 +253,153 @@ def upload_file():
         
         return jsonify({
             'success': True, 
-            'filename': full_filename,
+            'filename': os.path.basename(filepath),
             'filepath': normalized_filepath,
-            'preview_url': url_for('static', filename=f'uploads/{full_filename}')
+            'sha256': image_hash,
+            'preview_url': _preview_url(filepath)
+        })
+
+@app.route('/bulk_upload', methods=['POST'])
+def bulk_upload():
+    """批量上传多张图片或zip压缩包，全部提交后台处理，返回批次ID
+    
+    传入已有的 batch_id 可把多次上传归入同一批次
+    """
+    uploads = request.files.getlist('files') or request.files.getlist('file')
+    if not uploads:
+        return jsonify({'success': False, 'message': '没有文件上传'})
+    
+    batch_id = request.form.get('batch_id') or uuid.uuid4().hex
+    if not re.fullmatch(r'[0-9a-f]{32}', batch_id):
+        return jsonify({'success': False, 'message': '批次ID格式不正确'})
+    
+    saved = []
+    skipped = []
+    try:
+        for upload in uploads:
+            ext = os.path.splitext(upload.filename or '')[1].lower()
+            if ext == '.zip' or upload.mimetype in ('application/zip', 'application/x-zip-compressed'):
+                _save_zip_images(upload.stream, saved, skipped)
+            elif ext in app.config['IMAGE_EXTENSIONS']:
+                _check_bulk_count(saved)
+                saved.append(_save_upload_image(upload.stream, upload.filename, ext))
+            else:
+                skipped.append(upload.filename)
+    except (ValueError, zipfile.BadZipFile) as e:
+        for item in saved:
+            upload_store.release(item['filepath'])
+        return jsonify({'success': False, 'message': f'批量上传失败: {str(e)}'})
+    
+    if not saved:
+        return jsonify({'success': False, 'message': '没有可处理的图片', 'skipped': skipped})
+    
+    # 所有图片提交后台并发处理
+    config = load_config()
+    jobs = []
+    for item in saved:
+        job_id = job_store.create(batch_id=batch_id, filename=item['filename'])
+        _submit_job(job_id, item['filepath'], config, item['sha256'], item['filename'],
+                    session_id=_current_session_id(), batch_id=batch_id)
+        jobs.append({
+            'job_id': job_id,
+            'filename': item['filename'],
+            'filepath': item['filepath'].replace('\\', '/'),
+            'sha256': item['sha256']
         })
+    logger.info(f"批量上传: 批次{batch_id}, 提交{len(jobs)}张图片, 跳过{len(skipped)}个文件")
+    
+    return jsonify({
+        'success': True,
+        'batch_id': batch_id,
+        'jobs': jobs,
+        'skipped': skipped,
+        'status_url': url_for('batch_status', batch_id=batch_id)
+    })
+
+@app.route('/batches/<batch_id>', methods=['GET'])
+def batch_status(batch_id):
+    """批次内各任务的状态和进度，句子明细通过各任务的 status_url 查询"""
+    batch = job_store.get_batch(batch_id)
+    if batch is None:
+        return jsonify({'success': False, 'message': '批次不存在或已过期'})
+    for job in batch['jobs']:
+        job['status_url'] = url_for('job_status', job_id=job['job_id'])
+    return jsonify({'success': True, **batch})
+
+def _save_upload_image(stream, original_name, ext):
+    """把一张图片写入上传目录，返回保存信息"""
+    image_hash, filepath = _store_upload(stream, ext)
+    return {
+        'filename': os.path.basename(original_name) or os.path.basename(filepath),
+        'filepath': filepath,
+        'sha256': image_hash
+    }
+
+def _check_bulk_count(saved):
+    """保存下一张图片前检查是否已达到单次上传的数量上限"""
+    if len(saved) >= app.config['BULK_MAX_FILES']:
+        raise ValueError(f"单次最多上传{app.config['BULK_MAX_FILES']}张图片")
+
+def _save_zip_images(stream, saved, skipped):
+    """逐个解压zip包中的图片到上传目录并追加到saved，非图片文件记入skipped
+    
+    中途出错时已解压的图片也在saved中，由调用方统一释放
+    """
+    total_size = 0
+    with zipfile.ZipFile(stream) as archive:
+        for member in archive.infolist():
+            if member.is_dir():
+                continue
+            ext = os.path.splitext(member.filename)[1].lower()
+            if ext not in app.config['IMAGE_EXTENSIONS']:
+                skipped.append(member.filename)
+                continue
+            
+            # 防止解压炸弹
+            total_size += member.file_size
+            if total_size > app.config['BULK_MAX_UNZIPPED_SIZE']:
+                raise ValueError("压缩包解压后过大")
+            
+            _check_bulk_count(saved)
+            with archive.open(member) as member_stream:
+                saved.append(_save_upload_image(member_stream, member.filename, ext))
+
+def _store_upload(stream, ext, head=b''):
+    """把数据流按内容哈希存入上传目录，返回 (哈希, 文件路径)"""
+    storage_sweeper.ensure_started()
+    return upload_store.put(stream, ext, head=head, max_bytes=app.config['MAX_CONTENT_LENGTH'])
+
+def _safe_extension(filename):
+    """取上传文件名的扩展名，含特殊字符时丢弃"""
+    ext = os.path.splitext(filename or '')[1].lower()
+    return ext if re.fullmatch(r'\.[0-9a-z]{1,8}', ext) else ''
+
+def _preview_url(filepath):
+    """上传目录中文件的预览地址"""
+    relative = os.path.relpath(filepath, app.config['UPLOAD_FOLDER']).replace(os.sep, '/')
+    return url_for('static', filename=f'uploads/{relative}')
+
+def _file_sha256(filepath, chunk_size=64 * 1024):
+    """计算文件内容的SHA-256"""
+    sha256 = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+def _image_hash(image_path, claimed=None):
+    """图片内容哈希，用作OCR缓存的键，总是在服务端确定
+    
+    上传目录中的文件直接取存储记录中的哈希，其他文件重新计算；客户端提供的
+    哈希只用于核对，不一致时记录警告
+    """
+    image_hash = upload_store.hash_of(image_path) or _file_sha256(image_path)
+    if claimed and claimed != image_hash:
+        logger.warning(f"客户端提供的哈希与文件内容不一致: {claimed}, 实际为 {image_hash}, 文件: {image_path}")
+    return image_hash
 
 @app.route('/process', methods=['POST'])
 def process_image():
-    global results_data
-    
     data = request.json
     image_path = data.get('filepath')
     
@@ -127,150 +412,485 @@ def process_image():
         error_msg = f"文件不存在: {image_path}"
         logger.error(error_msg)
         return jsonify({'success': False, 'message': error_msg})
+    upload_store.touch(image_path)
     
     config = load_config()
     
+    # 图片内容哈希，用于OCR结果缓存
+    image_hash = _image_hash(image_path, data.get('sha256'))
+    
+    # 异步模式：提交后台任务后立即返回任务ID，通过 /jobs/<job_id> 查询进度
+    if data.get('async') or request.args.get('async') == '1':
+        job_id = job_store.create()
+        _submit_job(job_id, image_path, config, image_hash, session_id=_current_session_id())
+        logger.info(f"已提交处理任务: {job_id}, 图片: {image_path}")
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status_url': url_for('job_status', job_id=job_id)
+        })
+    
+    # profile=1 返回各阶段耗时，profile=cpu / memory 另外附带本项目代码的CPU或内存分析
+    profile = request.args.get('profile') or data.get('profile')
     try:
-        # 调用OCR API
-        ocr_result = call_ocr_api(image_path, config)
-        
-        if not ocr_result:
-            return jsonify({'success': False, 'message': 'OCR识别失败'})
-        
-        # 解析OCR结果
-        result_data = json.loads(ocr_result)
+        with metrics.track('process_seconds', in_flight='process_in_flight', mode='sync'), \
+                Trace('process', profile=profile, image=os.path.basename(image_path)) as trace:
+            result = _run_pipeline(image_path, config, image_hash, session_id=_current_session_id())
+        trace_store.record(trace)
+        if profile:
+            result['trace'] = trace.to_dict()
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'处理过程出错: {str(e)}'})
 
-        print("result_data",result_data)
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': '任务不存在或已过期'})
+    return jsonify({'success': True, **job})
 
-        # text_content = result_data.get("data", "")
+@app.route('/process_stream', methods=['GET'])
+def process_stream():
+    """以Server-Sent Events流式返回处理结果
+    
+    事件顺序：ocr（识别文本）→ 每句完成时一个 sentence → summary；出错时为 error
+    命中已知错别字的句子会先收到一个词典结果，模型结果返回后同一 index 再发送一次合并后的结果
+    """
+    image_path = request.args.get('filepath')
+    if image_path:
+        image_path = image_path.replace('/', os.sep).replace('\\\\', os.sep)
+    
+    if not image_path or not os.path.exists(image_path):
+        error_msg = f"文件不存在: {image_path}"
+        logger.error(error_msg)
+        return jsonify({'success': False, 'message': error_msg})
+    
+    config = load_config()
+    image_hash = _image_hash(image_path, request.args.get('sha256'))
+    
+    # 处理在后台线程中进行，各阶段的结果通过队列交给响应生成器
+    events = queue.Queue()
+    session_id = _current_session_id()
+    
+    sentence_spans = []
+    
+    def on_ocr(text_content, spans):
+        sentence_spans.extend(spans)
+        events.put(('ocr', {'text': text_content, 'total': len(spans), 'spans': spans}))
+    
+    def on_sentence(index, total, sentence_result, item):
+        check_data = item['check_result']
+        if isinstance(check_data, str):
+            check_data = json.loads(check_data)
+        events.put(('sentence', {
+            'index': index,
+            'total': total,
+            'start': sentence_spans[index][0],
+            'end': sentence_spans[index][1],
+            'original': item['original'],
+            'wrong': bool(check_data.get('wrong', False)),
+            'annotation': check_data.get('annotation', ''),
+            'content_1': check_data.get('content_1', ''),
+            'skip_reason': check_data.get('skip_reason', ''),
+            'sentence': sentence_result
+        }))
+    
+    def run():
+        try:
+            with metrics.track('process_seconds', in_flight='process_in_flight', mode='stream'):
+                result = _run_pipeline(image_path, config, image_hash, on_sentence=on_sentence, on_ocr=on_ocr,
+                                       session_id=session_id)
+        except Exception as e:
+            result = {'success': False, 'message': f'处理过程出错: {str(e)}'}
+        if result['success']:
+            result['wrong_count'] = sum(1 for row in result['sentences'] if row['错别字'])
+            events.put(('summary', result))
+        else:
+            events.put(('error', result))
+        events.put(None)
+    
+    threading.Thread(target=run, name='process-stream', daemon=True).start()
+    
+    def generate():
+        while True:
+            event = events.get()
+            if event is None:
+                break
+            name, payload = event
+            yield f"event: {name}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
-        # 1. 解析 data 字段（它是 JSON 字符串）
-        data_dict = json.loads(result_data['data'])
+def _submit_job(job_id, image_path, config, image_hash, filename=None, session_id=None, batch_id=None):
+    """把处理任务提交到后台流水线"""
+    job_pipeline.submit({
+        'job_id': job_id,
+        'image_path': image_path,
+        'config': config,
+        'image_hash': image_hash,
+        'filename': filename,
+        'session_id': session_id,
+        'batch_id': batch_id
+    })
 
-        # 2. 获取 content 的值
-        text_content = data_dict['content']
+def _job_ocr_stage(job):
+    """流水线OCR阶段：识别失败时直接结束任务"""
+    job_id = job['job_id']
+    job['started'] = time.perf_counter()
+    job_store.start(job_id)
+    try:
+        ocr_output = _ocr_stage(job['image_path'], job['config'], job['image_hash'])
+    except Exception as e:
+        logger.error(f"处理任务失败({job_id}): {str(e)}")
+        import traceback
+        logger.error(traceback.format_exc())
+        job_store.fail(job_id, f'处理过程出错: {str(e)}')
+        return None
+    
+    if not ocr_output['success']:
+        job_store.fail(job_id, ocr_output['message'])
+        return None
+    return ocr_output
 
-        print("text_content",text_content)
-        if not text_content:
-            return jsonify({'success': False, 'message': 'OCR识别结果为空'})
-        
-        # 检查是否是系统提示词
-        # if text_content.startswith("作为") and ("文字秘书" in text_content or "文秘" in text_content):
-        #     return jsonify({'success': False, 'message': '检测到系统提示词，跳过检查'})
-        
-        # 按句号分割文本，确保每句话都有结尾标点
-        sentences = []
-        current_sentence = ""
-        for char in text_content:
-            current_sentence += char
-            if char in ['。', '！', '？', '…', '.', '!', '?']:
-                if current_sentence.strip():
-                    sentences.append(current_sentence.strip())
-                current_sentence = ""
-        if current_sentence.strip():  # 添加最后一句（如果没有结尾标点）
-            sentences.append(current_sentence.strip())
-        
-        processed_sentences = []
-        
-        for i, sentence in enumerate(sentences):
-            if not sentence.strip():
-                continue
-            
-            # 调用文字检查API
-            check_result = call_text_check_api(sentence, config)
-            
-            if check_result:
-                try:
-                    check_data = json.loads(check_result)
-                    processed_sentences.append({
-                        "original": sentence,
-                        "check_result": check_data
-                    })
-                except json.JSONDecodeError:
-                    processed_sentences.append({
-                        "original": sentence,
-                        "check_result": json.dumps({"annotation": "无", "content_1": "无"})
-                    })
-        
-        # 构建最终显示文本
-        display_text = f"文件：{os.path.basename(image_path)}\n"
-        display_text += "文本识别与检查结果：\n\n"
-        display_text += "原始文本：\n"
-        
-        # 格式化原始文本，每行最大长度为50个字符
-        line_length = 50
-        for i in range(0, len(text_content), line_length):
-            display_text += text_content[i:i+line_length] + "\n"
-        
-        display_text += "\n详细检查结果：\n"
-        
-        # 准备结果数据
-        sentence_results = []
-        
+def _job_check_stage(job, ocr_output):
+    """流水线检查阶段：逐句检查并把进度写入任务存储"""
+    job_id = job['job_id']
+    try:
+        result = _check_stage(
+            ocr_output, job['config'],
+            job['filename'] or os.path.basename(job['image_path']),
+            on_sentence=lambda index, total, sentence_result, item: job_store.add_sentence(job_id, index, total, sentence_result),
+            session_id=job['session_id'],
+            batch_id=job['batch_id']
+        )
+    except Exception as e:
+        logger.error(f"处理任务失败({job_id}): {str(e)}")
+        import traceback
+        logger.error(traceback.format_exc())
+        job_store.fail(job_id, f'处理过程出错: {str(e)}')
+        return
+    
+    job_store.finish(job_id, result)
+    metrics.observe('process_seconds', time.perf_counter() - job['started'], mode='job')
+
+# 后台任务流水线，各阶段并发数在config.json中配置
+job_pipeline = StagedPipeline(
+    _job_ocr_stage,
+    _job_check_stage,
+    ocr_workers=_startup_config.get('ocr_concurrency', 2),
+    check_workers=_startup_config.get('check_stage_concurrency', 2),
+    queue_size=_startup_config.get('pipeline_queue_size', 4)
+)
+
+def _pipeline_metrics():
+    stats = job_pipeline.stats()
+    return [
+        ('pipeline_queue_depth', {'stage': 'ocr'}, stats['ocr_queue']),
+        ('pipeline_queue_depth', {'stage': 'check'}, stats['check_queue']),
+        ('pipeline_active', {'stage': 'ocr'}, stats['ocr_active']),
+        ('pipeline_active', {'stage': 'check'}, stats['check_active'])
+    ]
+
+metrics.add_collector(_pipeline_metrics)
+
+def _run_pipeline(image_path, config, image_hash=None, on_sentence=None, on_ocr=None, filename=None,
+                  session_id=None):
+    """对单张图片执行OCR和逐句检查，返回与 /process 响应相同结构的字典
+    
+    filename 为结果中显示的文件名，默认取图片文件名
+    session_id 为结果归属的浏览器会话
+    on_ocr(text_content, spans) 在OCR和分句完成后调用，spans为每句在原文中的 (起, 止) 位置
+    on_sentence(index, total, sentence_result, item) 在每句检查完成时调用
+    """
+    ocr_output = _ocr_stage(image_path, config, image_hash)
+    if not ocr_output['success']:
+        return ocr_output
+    
+    if on_ocr:
+        on_ocr(ocr_output['text'], ocr_output['spans'])
+    
+    return _check_stage(ocr_output, config, filename or os.path.basename(image_path), on_sentence,
+                        session_id=session_id)
+
+def _ocr_stage(image_path, config, image_hash=None):
+    """OCR阶段：识别图片文字并分句"""
+    # 调用OCR API
+    with span('ocr'):
+        ocr_result = call_ocr_api(image_path, config, image_hash)
+    
+    if not ocr_result:
+        return {'success': False, 'message': 'OCR识别失败'}
+    
+    # 解析OCR结果
+    result_data = json.loads(ocr_result)
+
+    print("result_data",result_data)
+
+    # text_content = result_data.get("data", "")
+
+    # 1. 解析 data 字段（它是 JSON 字符串）
+    data_dict = json.loads(result_data['data'])
+
+    # 2. 获取 content 的值
+    text_content = data_dict['content']
+
+    print("text_content",text_content)
+    if not text_content:
+        return {'success': False, 'message': 'OCR识别结果为空'}
+    
+    # 检查是否是系统提示词
+    # if text_content.startswith("作为") and ("文字秘书" in text_content or "文秘" in text_content):
+    #     return {'success': False, 'message': '检测到系统提示词，跳过检查'}
+    
+    # 按句末标点分句，同时保留每句在原文中的位置
+    with span('segment', chars=len(text_content)):
+        spans = split_sentences(text_content)
+    
+    return {
+        'success': True,
+        'text': text_content,
+        'sentences': [span.text for span in spans],
+        'spans': [(span.start, span.end) for span in spans]
+    }
+
+def _check_stage(ocr_output, config, filename, on_sentence=None, session_id=None, batch_id=None):
+    """检查阶段：逐句检查并生成显示文本，结果数据保存到结果存储"""
+    text_content = ocr_output['text']
+    sentences = ocr_output['sentences']
+    metrics.observe('sentences_per_image', len(sentences))
+    
+    # 每句检查完成时回调，用于上报进度
+    on_result = None
+    if on_sentence:
+        def on_result(index, total, item):
+            on_sentence(index, total, _format_sentence_result(index + 1, item, filename)[1], item)
+    
+    # 并发调用文字检查API，结果保持原句顺序
+    with span('check', sentences=len(sentences)):
+        processed_sentences = _check_sentences(sentences, config, on_result)
+    
+    # 构建最终显示文本
+    display_text = f"文件：{filename}\n"
+    display_text += "文本识别与检查结果：\n\n"
+    display_text += "原始文本：\n"
+    
+    # 格式化原始文本，每行最大长度为50个字符
+    line_length = 50
+    for i in range(0, len(text_content), line_length):
+        display_text += text_content[i:i+line_length] + "\n"
+    
+    display_text += "\n详细检查结果：\n"
+    
+    # 准备结果数据
+    sentence_results = []
+    
+    with span('format'):
         for i, item in enumerate(processed_sentences, 1):
-            display_text += f"\n第{i}句：\n"
-            display_text += f"原文：{item['original']}\n"
-            
-            typo_text = "无"
-            suggestion_text = "无"
-            
-            if "check_result" in item:
-                check_data = item['check_result']
-                try:
-                    if isinstance(check_data, str):
-                        check_data = json.loads(check_data)
-                    
-                    if isinstance(check_data, dict):
-                        # 获取wrong字段和其他内容
-                        is_wrong = check_data.get("wrong", False)
-                        original_content = check_data.get("content_0", item['original'])
-                        annotation = check_data.get('annotation', '')
-                        suggestion = check_data.get('content_1', '')
-                        
-                        # 根据wrong字段决定是否显示错别字
-                        if is_wrong:
-                            # wrong=true时，显示annotation作为错别字
-                            typo_text = annotation
-                            suggestion_text = suggestion if suggestion and suggestion != "无" else "无"
-                            logger.info(f"检测到错别字 - wrong=true: {typo_text}")
-                        else:
-                            # wrong=false时，不显示错别字
-                            typo_text = "无"
-                            suggestion_text = "无"
-                            logger.info(f"无错别字 - wrong=false")
-                        
-                        # 调试输出
-                        logger.info(f"句子处理: wrong={is_wrong}, typo_text={typo_text}, suggestion={suggestion_text}")
-                except Exception as e:
-                    logger.error(f"处理检查结果时出错: {str(e)}")
-                    pass
-            
-            display_text += f"错别字：{typo_text}\n"
-            display_text += f"建议：{suggestion_text}\n"
-            display_text += "--------------------------------------------------\n"
+            sentence_text, sentence_result = _format_sentence_result(i, item, filename)
+            display_text += sentence_text
             
             # 添加到结果数据中
-            sentence_results.append({
-                "文件名称": os.path.basename(image_path),
-                "句子编号": str(i),
-                "原文": item['original'],
-                "错别字": typo_text if typo_text != "无" else "",
-                "建议": suggestion_text if suggestion_text != "无" else ""
-            })
-        
-        # 添加到全局结果数据
-        results_data.extend(sentence_results)
-        
-        return jsonify({
-            'success': True,
-            'result': display_text,
-            'sentences': sentence_results
-        })
+            sentence_results.append(sentence_result)
     
-    except Exception as e:
-        return jsonify({'success': False, 'message': f'处理过程出错: {str(e)}'})
+    # 保存到结果存储，并安排刷新当月报表
+    with span('store', rows=len(sentence_results)):
+        month = result_store.add_rows(sentence_results, session_id=session_id, batch_id=batch_id)
+    if month:
+        monthly_report.schedule_refresh(month)
+    
+    return {
+        'success': True,
+        'result': display_text,
+        'sentences': sentence_results
+    }
 
-def call_ocr_api(image_path, config):
+def _format_sentence_result(i, item, filename):
+    """生成第i句的显示文本和结果数据行"""
+    display_text = f"\n第{i}句：\n"
+    display_text += f"原文：{item['original']}\n"
+    
+    typo_text = "无"
+    suggestion_text = "无"
+    skip_reason = ""
+    
+    if "check_result" in item:
+        check_data = item['check_result']
+        try:
+            if isinstance(check_data, str):
+                check_data = json.loads(check_data)
+            
+            if isinstance(check_data, dict):
+                # 获取wrong字段和其他内容
+                is_wrong = check_data.get("wrong", False)
+                annotation = check_data.get('annotation', '')
+                suggestion = check_data.get('content_1', '')
+                skip_reason = check_data.get('skip_reason', '')
+                
+                # 根据wrong字段决定是否显示错别字
+                if is_wrong:
+                    # wrong=true时，显示annotation作为错别字
+                    typo_text = annotation
+                    suggestion_text = suggestion if suggestion and suggestion != "无" else "无"
+                    logger.info(f"检测到错别字 - wrong=true: {typo_text}")
+                else:
+                    # wrong=false时，不显示错别字
+                    typo_text = "无"
+                    suggestion_text = "无"
+                    logger.info(f"无错别字 - wrong=false")
+                
+                # 调试输出
+                logger.info(f"句子处理: wrong={is_wrong}, typo_text={typo_text}, suggestion={suggestion_text}")
+        except Exception as e:
+            logger.error(f"处理检查结果时出错: {str(e)}")
+            pass
+    
+    display_text += f"错别字：{typo_text}\n"
+    display_text += f"建议：{suggestion_text}\n"
+    if skip_reason:
+        # 本地分级跳过、没有送检的句子注明原因
+        display_text += f"未检查：{skip_reason}\n"
+    display_text += "--------------------------------------------------\n"
+    
+    sentence_result = {
+        "文件名称": filename,
+        "句子编号": str(i),
+        "原文": item['original'],
+        "错别字": typo_text if typo_text != "无" else "",
+        "建议": suggestion_text if suggestion_text != "无" else ""
+    }
+    return display_text, sentence_result
+
+def _check_sentences(sentences, config, on_result=None):
+    """并发检查句子列表，返回与原句顺序一致的检查结果
+    
+    on_result(index, total, item) 在每句结果返回时调用，调用顺序与完成顺序一致
+    """
+    sentences = [sentence for sentence in sentences if sentence.strip()]
+    if not sentences:
+        return []
+    total = len(sentences)
+    processed_sentences = [None] * total
+    
+    # 本地分级：页码、编号、网址等直接跳过，简单句可交给更便宜的模型
+    full_indices, cheap_indices = [], []
+    known_results = {}  # 正常检查的句子命中已知错别字的结果，模型结果返回后合并
+    dictionary_count = 0
+    triage_enabled = config.get('triage_enabled', True)
+    known_errors_enabled = config.get('known_errors_enabled', True)
+    for index, sentence in enumerate(sentences):
+        decision, reason = classify(sentence) if triage_enabled else (TRIAGE_FULL, '')
+        # 每句都先查已知错别字，命中时立即标记，“帐户”这类会被跳过的短词同样能标记出来
+        known_result = known_errors.check(sentence) if known_errors_enabled else None
+        if known_result:
+            dictionary_count += 1
+        if decision == TRIAGE_FULL:
+            # 正常检查的句子仍请求API，命中的结果先行上报
+            full_indices.append(index)
+            if known_result:
+                known_results[index] = known_result
+                if on_result:
+                    on_result(index, total, {"original": sentence, "check_result": known_result})
+            continue
+        # 跳过的句子和简单句命中时不再请求API
+        if known_result:
+            item = {"original": sentence, "check_result": known_result}
+        elif decision == TRIAGE_SKIP:
+            item = {
+                "original": sentence,
+                "check_result": {"wrong": False, "annotation": "无", "content_1": "无", "skip_reason": reason}
+            }
+        else:
+            cheap_indices.append(index)
+            continue
+        processed_sentences[index] = item
+        if on_result:
+            on_result(index, total, item)
+    skipped_count = total - len(full_indices) - len(cheap_indices) - (dictionary_count - len(known_results))
+    logger.info(f"本地分级: 跳过 {skipped_count} 句, 词典命中 {dictionary_count} 句, "
+                f"简单句 {len(cheap_indices)} 句, 正常检查 {len(full_indices)} 句")
+    
+    # 未配置便宜模型时简单句与其他句子一起打包
+    groups = [(full_indices, config)]
+    if config.get('cheap_model'):
+        groups.append((cheap_indices, dict(config, model=config['cheap_model'])))
+    else:
+        full_indices.extend(cheap_indices)
+        full_indices.sort()
+    
+    # 按句子数和总字数打包，每包一个请求；句子数为1表示逐句检查
+    batches = []
+    for indices, group_config in groups:
+        chunks = pack_chunks(
+            [sentences[index] for index in indices],
+            max_chars=max(1, int(config.get('check_batch_chars', 2000))),
+            max_items=max(1, int(config.get('check_batch_size', 10)))
+        )
+        for start, batch in chunks:
+            batches.append((indices[start:start + len(batch)], batch, group_config))
+    if not batches:
+        return [item for item in processed_sentences if item is not None]
+    
+    # 同时在途的请求数上限，可在config.json中配置
+    max_workers = max(1, int(config.get('check_concurrency', 8)))
+    max_workers = min(max_workers, len(batches))
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(propagate(call_text_check_batch_api), batch, group_config): indices
+            for indices, batch, group_config in batches
+        }
+        # 按完成顺序收集结果，放回原句所在位置
+        for future in as_completed(futures):
+            for index, check_result in zip(futures[future], future.result()):
+                item = _to_processed_item(sentences[index], check_result)
+                if index in known_results:
+                    item = _merge_known_result(sentences[index], known_results[index], item)
+                processed_sentences[index] = item
+                if item is not None and on_result:
+                    on_result(index, total, item)
+    
+    return [item for item in processed_sentences if item is not None]
+
+def _merge_known_result(sentence, known_result, item):
+    """把已知错别字的命中结果并入模型的检查结果，模型漏掉的错误补充到批注和修改建议中"""
+    check_data = item['check_result'] if item else None
+    if isinstance(check_data, str):
+        check_data = json.loads(check_data)
+    if not check_data or not check_data.get('wrong'):
+        return {"original": sentence, "check_result": known_result}
+    
+    annotation = check_data.get('annotation', '')
+    suggestion = check_data.get('content_1', '')
+    for wrong, right in extract_pairs(known_result['annotation']):
+        if wrong in annotation:
+            continue
+        annotation = f'{annotation}；"{wrong}" 应改为 "{right}"' if annotation else f'"{wrong}" 应改为 "{right}"'
+        if suggestion and suggestion != '无':
+            suggestion = suggestion.replace(wrong, right)
+    return {"original": sentence, "check_result": dict(check_data, annotation=annotation, content_1=suggestion)}
+
+def _to_processed_item(sentence, check_result):
+    """把检查API返回的JSON字符串转换为句子结果项"""
+    if not check_result:
+        return None
+    try:
+        check_data = json.loads(check_result)
+        return {
+            "original": sentence,
+            "check_result": check_data
+        }
+    except json.JSONDecodeError:
+        return {
+            "original": sentence,
+            "check_result": json.dumps({"annotation": "无", "content_1": "无"})
+        }
+
+def call_ocr_api(image_path, config, image_hash=None):
     try:
         # 获取文件的完整路径
         abs_path = os.path.abspath(image_path)
@@ -280,6 +900,18 @@ def call_ocr_api(image_path, config):
             logger.error(f"文件不存在: {abs_path}")
             return None
         
+        # 相同内容的图片直接使用缓存的识别结果，跳过上传和内容获取
+        if image_hash is None:
+            image_hash = _file_sha256(abs_path)
+        cached_text = ocr_cache.get(image_hash)
+        if cached_text is not None:
+            logger.info(f"OCR缓存命中: {image_hash}")
+            return json.dumps({
+                "code": "000000",
+                "data": cached_text,
+                "message": "成功"
+            })
+        
         # 从配置获取Kimi API密钥和URL
         kimi_api_key = config.get('kimi_api_key', '')
         kimi_upload_url = config.get('kimi_upload_url', 'https://api.moonshot.cn/v1/files')
@@ -295,13 +927,26 @@ def call_ocr_api(image_path, config):
         
         # 上传文件
         logger.info(f"开始上传文件: {abs_path}")
-        with open(abs_path, "rb") as file:
-            # 准备文件数据
-            files = {
-                "file": (os.path.basename(abs_path), file)
-            }
-            # 发起 POST 请求上传文件
-            upload_response = requests.post(kimi_upload_url, headers=headers, files=files)
+        # 读入文件内容，失败重试时可以重新发送；大图先压缩再上传
+        if config.get('image_preprocess', True):
+            with span('image_prep'):
+                upload_name, file_bytes = prepare_image(
+                    abs_path,
+                    max_side=int(config.get('image_max_side', 2048)),
+                    max_bytes=int(config.get('image_max_bytes', 1536 * 1024)),
+                    grayscale=bool(config.get('image_grayscale', True))
+                )
+        else:
+            upload_name = os.path.basename(abs_path)
+            with open(abs_path, "rb") as file:
+                file_bytes = file.read()
+        
+        # 准备文件数据
+        files = {
+            "file": (upload_name, file_bytes)
+        }
+        # 发起 POST 请求上传文件
+        upload_response = _request_upstream('POST', kimi_upload_url, stage='kimi_upload', headers=headers, files=files)
         
         # 输出上传响应以便调试
         logger.info(f"上传响应状态码: {upload_response.status_code}")
@@ -319,11 +964,11 @@ def call_ocr_api(image_path, config):
                 
                 logger.info(f"获取到的文件ID: {file_id}")
                 
-                # 获取文件内容 - 直接构建完整的URL
-                content_url = f"https://api.moonshot.cn/v1/files/{file_id}/content"
+                # 获取文件内容 - 与上传地址同一服务，便于指向代理或本地测试服务
+                content_url = f"{kimi_upload_url.rstrip('/')}/{file_id}/content"
                 logger.info(f"请求文件内容URL: {content_url}")
                 
-                content_response = requests.get(content_url, headers=headers)
+                content_response = _request_upstream('GET', content_url, stage='kimi_content', headers=headers)
                 
                 # 输出内容响应以便调试
                 logger.info(f"内容响应状态码: {content_response.status_code}")
@@ -334,6 +979,7 @@ def call_ocr_api(image_path, config):
                     # 构造与原先API相同格式的返回结果
                     text_content = content_response.text
                     logger.info(f"成功获取到文本内容，长度: {len(text_content)}")
+                    ocr_cache.set(image_hash, text_content)
                     result_data = {
                         "code": "000000",
                         "data": text_content,
@@ -364,6 +1010,19 @@ def call_ocr_api(image_path, config):
         logger.error(traceback.format_exc())
         return None
 
+# 默认的文字检查系统提示词
+DEFAULT_CHECK_PROMPT = "作为一个细致耐心的文字秘书，对下面的句子进行错别字检查，按如下结构以 JSON 格式输出：\n{\n\"content_0\":\"原始句子\",\n\"wrong\":true,//是否有需要被修正的错别字，布尔类型\n\"annotation\":\"\",//批注内容，string类型。如果wrong为true给出修正的解释；如果 wrong 字段为 false，则为空值\n\"content_1\":\"\"//修改后的句子，string类型。如果wrong为false则留空\n}"
+
+# 批量检查时追加在系统提示词之后的输出约定
+BATCH_CHECK_PROMPT = (
+    "\n\n## 批量检查\n"
+    "用户消息是一个JSON数组，每个元素包含句子编号index和原始句子content_0。"
+    "请逐句检查，并只输出一个JSON数组，数组中每个元素对应一个输入句子，格式为："
+    "{\"index\": 句子编号, \"content_0\": \"原始句子\", \"wrong\": true或false, "
+    "\"annotation\": \"批注内容\", \"content_1\": \"修改后的句子\"}。"
+    "不要遗漏任何句子，不要输出数组以外的内容。"
+)
+
 def call_text_check_api(text, config):
     try:
         # 获取配置参数
@@ -372,60 +1031,30 @@ def call_text_check_api(text, config):
         model = config.get('model', 'deepseek-chat')
         
         # 获取系统提示词
-        system_prompt = config.get("system_prompt", "作为一个细致耐心的文字秘书，对下面的句子进行错别字检查，按如下结构以 JSON 格式输出：\n{\n\"content_0\":\"原始句子\",\n\"wrong\":true,//是否有需要被修正的错别字，布尔类型\n\"annotation\":\"\",//批注内容，string类型。如果wrong为true给出修正的解释；如果 wrong 字段为 false，则为空值\n\"content_1\":\"\"//修改后的句子，string类型。如果wrong为false则留空\n}")
+        system_prompt = config.get("system_prompt", DEFAULT_CHECK_PROMPT)
+        
+        # 命中缓存时直接返回，不再请求API
+        cache_key = sentence_cache_key(model, system_prompt, text)
+        cached_result = sentence_cache.get(cache_key)
+        if cached_result is not None:
+            logger.info(f"句子缓存命中: {text}")
+            return cached_result
         
         if not api_key:
             logger.error("文字检查API密钥未配置")
             return json.dumps({"annotation": "API密钥未配置", "content_1": "请配置API密钥"})
         
-        # 构建请求头和数据
-        headers = {
-            "Content-Type": "application/json; charset=utf-8",
-            "Authorization": f"Bearer {api_key}"
-        }
-        
-        # 处理输入文本
-        processed_text = text
-        
-        # 构建请求数据 - 修复JSON序列化问题
-        data = {
-            "model": model,
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": processed_text}
-            ],
-            "stream": False,
-            # 添加max_tokens参数
-            "max_tokens": 1024
-        }
-        
-        # 序列化请求数据
-        json_data = json.dumps(data, ensure_ascii=False).encode('utf-8')
-        
-        # 记录请求详情
-        _log_api_request(api_url, headers, model, system_prompt, text, data)
-        
-        # 发送请求
-        start_time = datetime.now()
-        response = requests.post(api_url, headers=headers, data=json_data)
-        
-        # 记录请求响应的全部信息
-        logger.info(f"Request URL: {api_url}")
-        logger.info(f"Request Headers: {headers}")
-        logger.info(f"Request Body: {json_data.decode('utf-8')}")
-        logger.info(f"Response Status: {response.status_code}")
-        logger.info(f"Response Headers: {response.headers}")
-        logger.info(f"Response Body: {response.text}")
-        
-        end_time = datetime.now()
-        response_time = (end_time - start_time).total_seconds()
-        
-        # 记录响应详情
-        _log_api_response(end_time, response_time, response.status_code, response.text)
+        # 请求头和含系统提示词的请求体前缀已预先构建，只需序列化句子
+        template = chat_template(api_url, api_key, model, system_prompt)
+        response = _send_text_check_request(template, text, template.body(text, 1024), stage='deepseek_check')
         
         # 处理成功响应
         if response.status_code == 200:
-            return _process_successful_response_new(response)
+            check_result = _process_successful_response_new(response)
+            if _is_cacheable_result(check_result):
+                sentence_cache.set(cache_key, check_result)
+                _learn_known_errors(text, check_result)
+            return check_result
         
         # 处理错误响应
         return _process_error_response(response.status_code)
@@ -437,6 +1066,191 @@ def call_text_check_api(text, config):
         logger.error(traceback.format_exc())
         return json.dumps({"annotation": error_details, "content_1": "请联系管理员或检查网络连接"}, ensure_ascii=False)
 
+def call_text_check_batch_api(sentences, config):
+    """在一次请求中批量检查多个句子，返回与输入顺序一致的检查结果列表
+    
+    缺失或格式不正确的句子单独回退到逐句检查
+    """
+    if len(sentences) == 1:
+        return [call_text_check_api(sentences[0], config)]
+    
+    # 先查缓存，只请求未命中的句子
+    model = config.get('model', 'deepseek-chat')
+    system_prompt = config.get("system_prompt", DEFAULT_CHECK_PROMPT)
+    cache_keys = [sentence_cache_key(model, system_prompt, sentence) for sentence in sentences]
+    check_results = [sentence_cache.get(cache_key) for cache_key in cache_keys]
+    pending = [i for i, check_result in enumerate(check_results) if check_result is None]
+    
+    if len(pending) > 1:
+        batch_results, cacheable = _request_text_check_batch([sentences[i] for i in pending], config)
+        for i, check_result in zip(pending, batch_results):
+            check_results[i] = check_result
+            if check_result is not None and cacheable:
+                sentence_cache.set(cache_keys[i], check_result)
+                _learn_known_errors(sentences[i], check_result)
+    
+    # 缺失或格式不正确的句子单独回退到逐句检查
+    for i, sentence in enumerate(sentences):
+        if check_results[i] is None:
+            if len(pending) > 1:
+                logger.warning(f"批量结果缺失，单独检查: {sentence}")
+            check_results[i] = call_text_check_api(sentence, config)
+    return check_results
+
+def _learn_known_errors(sentence, check_result):
+    """把模型确认的修改记入错别字词典"""
+    try:
+        check_data = json.loads(check_result)
+        if check_data.get('wrong'):
+            pairs = known_errors.learn(check_data.get('annotation', ''), sentence, check_data.get('content_1', ''))
+            if pairs:
+                logger.info(f"错别字词典记录: {pairs}")
+    except Exception as e:
+        logger.error(f"记录错别字词典出错: {str(e)}")
+
+def _request_text_check_batch(sentences, config):
+    """发送批量检查请求，返回 (结果列表, 是否可缓存)，无法解析的句子结果为None"""
+    try:
+        api_url = config.get('api2_url', 'https://api.deepseek.com/chat/completions')
+        api_key = config.get('api_key', '')
+        model = config.get('model', 'deepseek-chat')
+        system_prompt = config.get("system_prompt", DEFAULT_CHECK_PROMPT) + BATCH_CHECK_PROMPT
+        
+        if not api_key:
+            logger.error("文字检查API密钥未配置")
+            return [json.dumps({"annotation": "API密钥未配置", "content_1": "请配置API密钥"})] * len(sentences), False
+        
+        # 每个句子带上编号，便于将结果对应回原句
+        batch_text = json.dumps(
+            [{"index": i, "content_0": sentence} for i, sentence in enumerate(sentences)],
+            ensure_ascii=False
+        )
+        template = chat_template(api_url, api_key, model, system_prompt)
+        body = template.body(batch_text, min(8192, 1024 * len(sentences)))
+        response = _send_text_check_request(template, batch_text, body, stage='deepseek_batch')
+        
+        if response.status_code != 200:
+            error_result = _process_error_response(response.status_code)
+            return [error_result] * len(sentences), False
+        
+        return _parse_batch_response(response, sentences), True
+    
+    except Exception as e:
+        logger.error(f"批量检查出错，回退到逐句检查: {str(e)}")
+        return [None] * len(sentences), False
+
+def _send_text_check_request(template, text, json_data, stage='deepseek_check'):
+    """按请求模板发送文字检查请求，每次请求记录一条结构化日志
+    
+    请求体和响应体按 log_body_sample_rate 采样记录并截断，请求失败时总是记录
+    """
+    start_time = time.perf_counter()
+    response = _request_upstream('POST', template.api_url, stage=stage, headers=template.headers, data=json_data)
+    elapsed = time.perf_counter() - start_time
+    
+    fields = {
+        'url': template.api_url,
+        'model': template.model,
+        'status': response.status_code,
+        'elapsed_ms': round(elapsed * 1000, 1),
+        'text_chars': len(text),
+        'request_bytes': len(json_data),
+        'response_bytes': len(response.content)
+    }
+    sample_rate, max_chars = _log_body_settings()
+    failed = response.status_code != 200
+    request_body = sample_body(json_data.decode('utf-8'), sample_rate, max_chars, force=failed)
+    if request_body is not None:
+        fields['request_body'] = request_body
+        fields['response_body'] = sample_body(response.text, 1, max_chars)
+    
+    if failed:
+        logger.warning("文字检查请求失败", extra={'fields': fields})
+    else:
+        logger.info("文字检查请求", extra={'fields': fields})
+    return response
+
+def _log_body_settings():
+    """日志中记录请求/响应内容的采样率和最大字数"""
+    config = load_config()
+    return float(config.get('log_body_sample_rate', 0.01)), int(config.get('log_body_max_chars', 2000))
+
+def _parse_batch_response(response, sentences):
+    """解析批量检查的响应，返回按句子编号排列的结果列表，无法解析的句子为None"""
+    batch_results = [None] * len(sentences)
+    try:
+        response_data = response.json()
+        content = response_data['choices'][0]['message']['content']
+    except (ValueError, KeyError, IndexError, TypeError) as e:
+        logger.error(f"批量响应格式不正确: {str(e)}")
+        return batch_results
+    
+    reply = sample_body(content, *_log_body_settings())
+    if reply is not None:
+        logger.info(f"助手回复(批量): {reply}")
+    content = strip_code_fence(content)
+    
+    try:
+        items = json.loads(content)
+    except json.JSONDecodeError:
+        # 尝试提取数组部分：第一个 [ 到最后一个 ] 之间的内容
+        start = content.find('[')
+        end = content.rfind(']')
+        if start == -1 or end < start:
+            logger.warning(f"批量回复中未找到JSON数组: {content}")
+            return batch_results
+        try:
+            items = json.loads(content[start:end + 1])
+        except json.JSONDecodeError as e:
+            logger.warning(f"批量回复JSON解析失败: {str(e)}")
+            return batch_results
+    
+    # 兼容 {"results": [...]} 这类包了一层的输出
+    if isinstance(items, dict):
+        items = next((value for value in items.values() if isinstance(value, list)), [])
+    if not isinstance(items, list):
+        return batch_results
+    
+    for position, item in enumerate(items):
+        if not isinstance(item, dict) or 'wrong' not in item:
+            continue
+        index = item.get('index', position)
+        try:
+            index = int(index)
+        except (TypeError, ValueError):
+            continue
+        if 0 <= index < len(sentences) and batch_results[index] is None:
+            batch_results[index] = json.dumps(build_check_result(item), ensure_ascii=False)
+    
+    return batch_results
+
+def _request_upstream(method, url, stage='other', **kwargs):
+    """经自适应限流发送上游请求，遇到429、5xx或网络异常时自动退避重试
+    
+    stage 为耗时指标的标签和追踪区间名，每次尝试的响应状态码分别计数
+    """
+    limiter = upstream_limiters.for_url(url)
+    host = urlsplit(url).hostname or url
+    
+    def send():
+        metrics.inc('upstream_in_flight', 1, host=host)
+        try:
+            response = http_client.request(method, url, **kwargs)
+        except Exception:
+            metrics.inc('upstream_responses_total', host=host, status='error')
+            raise
+        finally:
+            metrics.inc('upstream_in_flight', -1, host=host)
+        metrics.inc('upstream_responses_total', host=host, status=str(response.status_code))
+        return response
+    
+    with metrics.track('upstream_request_seconds', stage=stage), span(stage, host=host):
+        return request_with_retry(
+            limiter,
+            send,
+            max_retries=int(load_config().get('upstream_max_retries', 3))
+        )
+
 def _fix_incomplete_json(text):
     """修复不完整的JSON字符串"""
     fixed_text = text
@@ -447,40 +1261,6 @@ def _fix_incomplete_json(text):
     logger.info(f"修复后的文本: {fixed_text}")
     return fixed_text
 
-def _log_api_request(api_url, headers, model, system_prompt, text, data):
-    """记录API请求详情"""
-    logger.info(f"\n==================== 文字检查API请求信息 ====================")
-    logger.info(f"请求时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    logger.info(f"请求URL: {api_url}")
-    logger.info(f"请求方法: POST")
-    # 隐藏敏感信息
-    sanitized_headers = headers.copy()
-    if 'Authorization' in sanitized_headers:
-        auth_parts = sanitized_headers['Authorization'].split(' ')
-        if len(auth_parts) > 1:
-            sanitized_headers['Authorization'] = f"{auth_parts[0]} {'*' * 8}{auth_parts[1][-4:]}"
-    logger.info(f"请求头(脱敏): {json.dumps(sanitized_headers, ensure_ascii=False, indent=2)}")
-    logger.info(f"模型: {model}")
-    logger.info(f"系统提示词: {system_prompt}")
-    logger.info(f"检查文本: {text}")
-    logger.info(f"请求体: {json.dumps(data, ensure_ascii=False, indent=2)}")
-    logger.info("==============================================================\n")
-
-def _log_api_response(end_time, response_time, status_code, response_text):
-    """记录API响应详情"""
-    logger.info(f"\n==================== 文字检查API响应信息 ====================")
-    logger.info(f"响应时间: {end_time.strftime('%Y-%m-%d %H:%M:%S')}")
-    logger.info(f"请求耗时: {response_time:.3f}秒")
-    logger.info(f"响应状态码: {status_code}")
-    
-    if len(response_text) > 500:
-        logger.info(f"响应内容(前500字符): {response_text[:500]}...")
-        logger.info(f"响应内容(后500字符): ...{response_text[-500:]}")
-        logger.info(f"响应内容长度: {len(response_text)}字符")
-    else:
-        logger.info(f"响应内容: {response_text}")
-    logger.info("==============================================================\n")
-
 def _process_successful_response_new(response):
     """处理成功的API响应，使用新的JSON格式"""
     try:
@@ -490,73 +1270,17 @@ def _process_successful_response_new(response):
         # 从响应中提取助手消息内容
         if 'choices' in response_data and len(response_data['choices']) > 0:
             content = response_data['choices'][0]['message']['content']
-            logger.info(f"助手回复: {content}")
+            # 回复和解析结果按同一次采样决定是否记录
+            sample_rate, max_chars = _log_body_settings()
+            reply = sample_body(content, sample_rate, max_chars)
+            if reply is not None:
+                logger.info(f"助手回复: {reply}")
             
-            # 预处理：去除可能的代码块标记
-            # 检查是否包含 ```json 或 ``` 标记
-            content = content.strip()
-            if content.startswith("```json"):
-                content = content[7:]  # 去除开头的 ```json
-            elif content.startswith("```"):
-                content = content[3:]  # 去除开头的 ```
-                
-            if content.endswith("```"):
-                content = content[:-3]  # 去除结尾的 ```
-                
-            content = content.strip()
-            
-            # 尝试解析为JSON
-            try:
-                json_content = json.loads(content)
-                logger.info(f"成功解析为JSON: {json_content}")
-                
-                # 检查wrong字段
-                is_wrong = json_content.get("wrong", False)
-                
-                # 创建结果
-                result = {
-                    "wrong": is_wrong,  # 添加wrong字段到结果中
-                    "annotation": json_content.get("annotation", "") if is_wrong else "无",
-                    "content_1": json_content.get("content_1", "") if is_wrong else "无"
-                }
-                
-                logger.info(f"处理结果: {result}")
-                return json.dumps(result, ensure_ascii=False)
-                
-            except json.JSONDecodeError as e:
-                # JSON解析失败，记录详细错误并尝试进一步处理
-                logger.warning(f"JSON解析错误: {str(e)}")
-                logger.warning(f"尝试解析的内容: {content}")
-                
-                # 尝试更宽容的解析方式
-                try:
-                    # 使用正则表达式提取JSON部分
-                    import re
-                    json_match = re.search(r'\{.*\}', content, re.DOTALL)
-                    if json_match:
-                        json_str = json_match.group(0)
-                        logger.info(f"提取到的JSON字符串: {json_str}")
-                        json_content = json.loads(json_str)
-                        
-                        # 检查wrong字段
-                        is_wrong = json_content.get("wrong", False)
-                        
-                        # 创建结果
-                        result = {
-                            "wrong": is_wrong,  # 添加wrong字段到结果中
-                            "annotation": json_content.get("annotation", "") if is_wrong else "无",
-                            "content_1": json_content.get("content_1", "") if is_wrong else "无"
-                        }
-                        
-                        logger.info(f"处理结果(备选解析): {result}")
-                        return json.dumps(result, ensure_ascii=False)
-                    else:
-                        # 没有找到JSON结构，使用文本处理
-                        return _process_text_content(content)
-                except Exception as json_e:
-                    logger.warning(f"备选JSON解析也失败: {str(json_e)}")
-                    # 所有JSON解析方法都失败，使用文本处理
-                    return _process_text_content(content)
+            # 去除可能的代码块标记后依次按JSON、JSON片段、文本解析
+            result = parse_check_reply(strip_code_fence(content))
+            if reply is not None:
+                logger.info(f"处理结果: {sample_body(result, 1, max_chars)}")
+            return result
         else:
             logger.error(f"响应格式不正确: {response_data}")
             return json.dumps({"wrong": False, "annotation": "API响应格式不正确", "content_1": "请联系管理员"})
@@ -567,50 +1291,10 @@ def _process_successful_response_new(response):
         logger.error(traceback.format_exc())
         return json.dumps({"wrong": False, "annotation": error_details, "content_1": "请联系管理员"})
 
-def _process_text_content(content):
-    """处理文本格式的内容"""
-    logger.warning(f"返回内容不是有效的JSON格式: {content}")
-    
-    # 检查是否包含"没有错别字"等关键词
-    no_error_keywords = ["没有错别字", "无错别字", "无错误", "无拼写错误", "无需修改", "无误", "准确", "正确"]
-    if any(phrase in content.lower() for phrase in no_error_keywords):
-        return json.dumps({"annotation": "无", "content_1": "无"}, ensure_ascii=False)
-    
-    # 尝试从文本中提取错别字信息
-    # 增强正则表达式，支持更多格式
-    error_match = re.search(r'错别字[:：](.*?)(?:建议[:：]|$)', content, re.DOTALL)
-    
-    # 如果上面的方式没找到，尝试查找"应为"或"应该是"的模式
-    if not error_match:
-        # 查找"X应为Y"或"X应该是Y"格式
-        typo_match = re.search(r'[""「](.+?)[""」]\s*应(?:该)?[为是]\s*[""「](.+?)[""」]', content)
-        if typo_match:
-            old_word, correct_word = typo_match.group(1), typo_match.group(2)
-            error = f'"{old_word}" 应改为 "{correct_word}"'
-            logger.info(f"使用'应为'模式提取到错别字: {error}")
-            return json.dumps({"annotation": error, "content_1": content}, ensure_ascii=False)
-    
-    suggestion_match = re.search(r'建议[:：](.*?)$', content, re.DOTALL)
-    
-    error = error_match.group(1).strip() if error_match else "无"
-    suggestion = suggestion_match.group(1).strip() if suggestion_match else "无"
-    
-    # 如果错误信息为"无"，但内容中有明显的错别字提示，尝试进一步分析
-    if error == "无" and ("错别字" in content or "应为" in content or "应改为" in content):
-        # 尝试查找格式为"X是错别字，应为Y"的模式
-        alt_match = re.search(r'[""「](.+?)[""」].*?错别字.*?应(?:该)?[为是]\s*[""「](.+?)[""」]', content, re.DOTALL)
-        if alt_match:
-            old_word, correct_word = alt_match.group(1), alt_match.group(2)
-            error = f'"{old_word}" 应改为 "{correct_word}"'
-            logger.info(f"使用备用模式提取到错别字: {error}")
-    
-    # 如果无法提取到具体的错别字或建议，则使用全文作为建议
-    if error == "无" and suggestion == "无":
-        result = {"annotation": "无", "content_1": content}
-    else:
-        result = {"annotation": error, "content_1": suggestion}
-    
-    return json.dumps(result, ensure_ascii=False)
+def _is_cacheable_result(check_result):
+    """API响应格式异常时得到的结果不写入缓存"""
+    annotation = json.loads(check_result).get('annotation', '')
+    return not annotation.startswith(('API响应格式不正确', '处理API响应时出错'))
 
 def _process_error_response(status_code):
     """根据状态码处理错误响应"""
@@ -620,7 +1304,7 @@ def _process_error_response(status_code):
         401: ("API认证失败(401)", "请检查API密钥是否正确"),
         403: ("API权限不足(403)", "请确认API密钥有足够的权限"),
         404: ("API接口不存在(404)", "请检查API URL是否正确"),
-        429: ("API请求过多(429)", "请降低请求频率或提高API限额")
+        429: ("API请求过多(429)", "已自动重试仍被限流，请稍后重试或提高API限额")
     }
     
     # 获取错误信息和解决方案
@@ -638,29 +1322,79 @@ def _process_error_response(status_code):
     
     return json.dumps({"annotation": error_message, "content_1": solution}, ensure_ascii=False)
 
+# 图片文件头魔数 -> 扩展名
+_IMAGE_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', '.png'),
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'GIF87a', '.gif'),
+    (b'GIF89a', '.gif'),
+    (b'BM', '.bmp'),
+    (b'II*\x00', '.tif'),
+    (b'MM\x00*', '.tif'),
+)
+
+def _sniff_image_extension(head):
+    """根据文件头判断图片格式，返回扩展名，无法识别返回None"""
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return '.webp'
+    for signature, ext in _IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return ext
+    return None
+
+def _read_head(stream, size=16):
+    """从流中读出开头的size个字节（流可能分多次返回）"""
+    head = b''
+    while len(head) < size:
+        chunk = stream.read(size - len(head))
+        if not chunk:
+            break
+        head += chunk
+    return head
+
 @app.route('/paste', methods=['POST'])
 def paste_image():
-    data = request.json
-    if not data or 'image_data' not in data:
-        return jsonify({'success': False, 'message': '没有收到图片数据'})
+    """保存粘贴的图片
     
-    image_data = data['image_data']
-    # 去除base64前缀
-    if ',' in image_data:
-        image_data = image_data.split(',')[1]
+    支持三种请求体：application/octet-stream 或 image/* 原始字节、
+    multipart表单中的file字段，以及JSON中的base64 image_data
+    """
+    if request.mimetype == 'application/octet-stream' or request.mimetype.startswith('image/'):
+        # request.stream 不受 MAX_CONTENT_LENGTH 限制，需要自己检查
+        if request.content_length is None:
+            return jsonify({'success': False, 'message': '请求缺少Content-Length'})
+        if request.content_length > app.config['MAX_CONTENT_LENGTH']:
+            return jsonify({'success': False, 'message': '图片过大'})
+        stream = request.stream
+    elif request.files.get('file'):
+        stream = request.files['file'].stream
+    else:
+        data = request.get_json(silent=True)
+        if not data or 'image_data' not in data:
+            return jsonify({'success': False, 'message': '没有收到图片数据'})
+        
+        image_data = data['image_data']
+        # 去除base64前缀
+        if ',' in image_data:
+            image_data = image_data.split(',')[1]
+        try:
+            stream = io.BytesIO(base64.b64decode(image_data))
+        except Exception as e:
+            logger.error(f"处理粘贴图片失败: {str(e)}")
+            return jsonify({'success': False, 'message': f'处理图片失败: {str(e)}'})
     
     try:
-        # 解码base64数据
-        image_bytes = base64.b64decode(image_data)
-        # 打开图片
-        image = Image.open(io.BytesIO(image_bytes))
+        # 只读文件头判断格式，图片内容原样保存，不再解码和重新编码
+        head = _read_head(stream)
+        if not head:
+            return jsonify({'success': False, 'message': '没有收到图片数据'})
+        ext = _sniff_image_extension(head)
+        if ext is None:
+            return jsonify({'success': False, 'message': '不支持的图片格式'})
         
-        # 生成唯一文件名
-        filename = f"paste_{uuid.uuid4().hex[:8]}_{int(datetime.now().timestamp())}.png"
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        
-        # 保存图片
-        image.save(filepath)
+        # 边接收边写入文件，同时计算内容哈希，相同内容只保存一份
+        image_hash, filepath = _store_upload(stream, ext, head=head)
+        filename = os.path.basename(filepath)
         
         # 确保返回的路径使用正斜杠
         normalized_filepath = filepath.replace('\\', '/')
@@ -670,7 +1404,8 @@ def paste_image():
             'success': True,
             'filename': filename,
             'filepath': normalized_filepath,
-            'preview_url': url_for('static', filename=f'uploads/{filename}')
+            'sha256': image_hash,
+            'preview_url': _preview_url(filepath)
         })
     
     except Exception as e:
@@ -679,22 +1414,29 @@ def paste_image():
 
 @app.route('/export', methods=['GET'])
 def export_excel():
-    global results_data
+    # 默认导出当前会话的结果，指定batch_id时导出该批次
+    scope = _result_scope()
     
-    if not results_data:
+    if not result_store.count(**scope):
         return jsonify({'success': False, 'message': '没有可导出的数据'})
     
     try:
-        # 创建Excel文件名（含年月）
+        # 创建Excel文件名（含年月），每次导出带随机后缀，不同会话的导出互不覆盖，也无法猜到别人的文件名
         current_date = datetime.now()
-        filename = f"自动文字巡检结果{current_date.year}年{current_date.month}月.xlsx"
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        
-        # 创建DataFrame
-        df = pd.DataFrame(results_data)
+        filename = f"自动文字巡检结果{current_date.year}年{current_date.month}月_{uuid.uuid4().hex}.xlsx"
+        filepath = os.path.join(app.config['EXPORT_FOLDER'], filename)
+        storage_sweeper.ensure_started()
         
-        # 保存为Excel
-        df.to_excel(filepath, index=False)
+        # 以只写模式逐行写入，先写临时文件再替换，不把全部结果读入内存
+        fd, tmp_path = tempfile.mkstemp(dir=app.config['EXPORT_FOLDER'], suffix='.xlsx.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as output:
+                for chunk in _generate_xlsx(result_store.iter_rows(**scope)):
+                    output.write(chunk)
+            os.replace(tmp_path, filepath)
+        except Exception:
+            os.remove(tmp_path)
+            raise
         
         # 返回文件下载链接
         return jsonify({
@@ -705,16 +1447,167 @@ def export_excel():
     except Exception as e:
         return jsonify({'success': False, 'message': f'导出失败: {str(e)}'})
 
+@app.route('/export_stream', methods=['GET'])
+def export_stream():
+    """把结果直接流式写入响应，不落地到上传目录
+    
+    参数：format=xlsx|csv|jsonl，only_wrong=1 只导出有错别字的行，
+    start/end=YYYY-MM-DD 按处理日期筛选（含首尾两天），batch_id 指定批次
+    """
+    export_format = request.args.get('format', 'xlsx').lower()
+    if export_format not in ('xlsx', 'csv', 'jsonl'):
+        return jsonify({'success': False, 'message': f'不支持的导出格式: {export_format}'})
+    
+    try:
+        filters = _result_scope()
+        filters['only_wrong'] = request.args.get('only_wrong') == '1'
+        if request.args.get('start'):
+            filters['start'] = datetime.strptime(request.args['start'], '%Y-%m-%d').timestamp()
+        if request.args.get('end'):
+            filters['end'] = (datetime.strptime(request.args['end'], '%Y-%m-%d') + timedelta(days=1)).timestamp()
+    except ValueError:
+        return jsonify({'success': False, 'message': '日期格式应为 YYYY-MM-DD'})
+    
+    if not result_store.count(**filters):
+        return jsonify({'success': False, 'message': '没有可导出的数据'})
+    
+    current_date = datetime.now()
+    filename = f"自动文字巡检结果{current_date.year}年{current_date.month}月.{export_format}"
+    rows = result_store.iter_rows(**filters)
+    
+    if export_format == 'csv':
+        body, mimetype = _generate_csv(rows), 'text/csv; charset=utf-8'
+    elif export_format == 'jsonl':
+        body, mimetype = _generate_jsonl(rows), 'application/x-ndjson; charset=utf-8'
+    else:
+        body, mimetype = _generate_xlsx(rows), 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f"attachment; filename*=UTF-8''{quote(filename)}"}
+    )
+
+def _generate_csv(rows, chunk_rows=500):
+    """逐块生成CSV内容，带BOM以便Excel正确识别中文"""
+    headers = [header for _, header in RESULT_COLUMNS]
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=headers)
+    buffer.write('\ufeff')
+    writer.writeheader()
+    for i, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if i % chunk_rows == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+def _generate_jsonl(rows):
+    """每行一个JSON对象"""
+    for row in rows:
+        yield (json.dumps(row, ensure_ascii=False) + '\n').encode('utf-8')
+
+def _generate_xlsx(rows, chunk_size=64 * 1024):
+    """以只写模式逐行写入xlsx，写完后分块输出
+    
+    xlsx是zip格式，只能整体写完后再发送；只写模式下行数据不会常驻内存
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('巡检结果')
+    headers = [header for _, header in RESULT_COLUMNS]
+    sheet.append(headers)
+    for row in rows:
+        sheet.append([row[header] for header in headers])
+    
+    with tempfile.TemporaryFile() as output:
+        workbook.save(output)
+        output.seek(0)
+        for chunk in iter(lambda: output.read(chunk_size), b''):
+            yield chunk
+
+@app.route('/monthly_report', methods=['GET'])
+def download_monthly_report():
+    """下载月度巡检报表（含明细、按文件统计和常见错别字），month=YYYY-MM，默认当月"""
+    month = request.args.get('month') or datetime.now().strftime('%Y-%m')
+    if not re.fullmatch(r'\d{4}-\d{2}', month) or not 1 <= int(month[5:]) <= 12:
+        return jsonify({'success': False, 'message': '月份格式应为 YYYY-MM'})
+    if not result_store.monthly_version(month):
+        return jsonify({'success': False, 'message': '该月没有巡检数据'})
+    
+    try:
+        path = monthly_report.ensure(month)
+        return send_file(path, as_attachment=True, download_name=os.path.basename(path))
+    except Exception as e:
+        logger.error(f"生成月度报表失败: {str(e)}")
+        return jsonify({'success': False, 'message': f'导出失败: {str(e)}'})
+
 @app.route('/download/<filename>')
 def download_file(filename):
-    return send_file(os.path.join(app.config['UPLOAD_FOLDER'], filename), as_attachment=True)
+    # 下载时去掉导出文件名中的随机后缀
+    download_name = re.sub(r'_[0-9a-f]{32}(?=\.xlsx$)', '', filename)
+    return send_from_directory(os.path.abspath(app.config['EXPORT_FOLDER']), filename, as_attachment=True,
+                               download_name=download_name)
 
 @app.route('/clear_results', methods=['POST'])
 def clear_results():
-    global results_data
-    results_data = []
+    result_store.clear(**_result_scope())
     return jsonify({'success': True})
 
+def _result_scope():
+    """请求对应的结果范围：指定batch_id时为该批次，否则为当前会话"""
+    batch_id = request.args.get('batch_id') or (request.get_json(silent=True) or {}).get('batch_id')
+    if batch_id:
+        return {'batch_id': batch_id}
+    return {'session_id': _current_session_id()}
+
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    return jsonify({'success': True, 'sentence': sentence_cache.stats(), 'ocr': ocr_cache.stats(),
+                    'known_errors': known_errors.stats()})
+
+@app.route('/storage_stats', methods=['GET'])
+def storage_stats():
+    return jsonify({'success': True, 'uploads': upload_store.stats()})
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus格式的运行指标，汇总所有worker进程"""
+    cache_samples = {'hits': [], 'misses': [], 'ratio': [], 'entries': []}
+    for name, cache in (('sentence', sentence_cache), ('ocr', ocr_cache)):
+        stats = cache.stats()
+        cache_samples['hits'].append(({'cache': name}, stats['hits']))
+        cache_samples['misses'].append(({'cache': name}, stats['misses']))
+        cache_samples['ratio'].append(({'cache': name}, stats['hit_ratio']))
+        cache_samples['entries'].append(({'cache': name}, stats['entries']))
+    upstream_limits = [({'host': host}, state['limit']) for host, state in upstream_limiters.states().items()]
+    
+    body = metrics.render(extra=[
+        ('cache_hits_total', 'counter', '缓存命中次数', cache_samples['hits']),
+        ('cache_misses_total', 'counter', '缓存未命中次数', cache_samples['misses']),
+        ('cache_hit_ratio', 'gauge', '缓存命中率', cache_samples['ratio']),
+        ('cache_entries', 'gauge', '缓存条目数', cache_samples['entries']),
+        ('upstream_concurrency_limit', 'gauge', '上游API当前的自适应并发上限', upstream_limits)
+    ])
+    return Response(body, mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/traces', methods=['GET'])
+def traces():
+    """耗时最长的 /process 请求"""
+    limit = int(request.args.get('limit', 20))
+    return jsonify({'success': True, 'traces': trace_store.slowest(limit)})
+
+@app.route('/traces/<trace_id>', methods=['GET'])
+def trace_detail(trace_id):
+    trace = trace_store.get(trace_id)
+    if trace is None:
+        return jsonify({'success': False, 'message': '追踪记录不存在'})
+    return jsonify({'success': True, 'trace': trace})
+
+@app.route('/upstream_stats', methods=['GET'])
+def upstream_stats():
+    return jsonify({'success': True, 'upstreams': upstream_limiters.states()})
+
 @app.route('/delete_image', methods=['POST'])
 def delete_image():
     data = request.json
@@ -728,11 +1621,18 @@ def delete_image():
         filepath = filepath.replace('/', os.sep).replace('\\\\', os.sep)
         logger.info(f"准备删除文件: 原始路径={data['filepath']}, 转换后={filepath}")
         
+        # 只允许删除上传目录中的文件
+        upload_root = os.path.abspath(app.config['UPLOAD_FOLDER'])
+        if os.path.commonpath([upload_root, os.path.abspath(filepath)]) != upload_root:
+            return jsonify({'success': False, 'message': '只能删除上传目录中的文件'})
+        
         # 检查文件是否存在
         if os.path.exists(filepath):
-            # 删除文件
-            os.remove(filepath)
-            logger.info(f"已删除文件: {filepath}")
+            # 减少一次引用，没有其他引用时删除文件
+            if upload_store.release(filepath):
+                logger.info(f"已删除文件: {filepath}")
+            else:
+                logger.info(f"文件仍被其他上传引用，保留: {filepath}")
             return jsonify({'success': True})
         else:
             # 文件已经不存在
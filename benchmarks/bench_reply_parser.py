@@ -0,0 +1,180 @@
+"""回复解析的回归检查和性能基准：对比 app.py 原有的解析实现与 reply_parser
+
+用法：python benchmarks/bench_reply_parser.py [--corpus 语料文件] [--repeat 次数]
+
+语料由 extract_replies.py 从日志生成，另外附带若干覆盖各个分支的构造样例。
+每条回复的新旧输出（包括异常时的错误结果）必须完全一致，否则以非零状态退出。
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reply_parser import strip_code_fence, parse_check_reply
+from extract_replies import DEFAULT_CORPUS, load_corpus
+
+# 覆盖各个分支的构造样例
+SYNTHETIC_REPLIES = [
+    '{"content_0": "今天天气很好。", "wrong": false, "annotation": "", "content_1": ""}',
+    '```json\n{"content_0": "他在在家。", "wrong": true, "annotation": "\\"在在\\" 应改为 \\"在\\"", "content_1": "他在家。"}\n```',
+    '```\n{"wrong": true, "annotation": "多字", "content_1": "改后"}\n```',
+    '{"wrong": true, "annotation": "缺少结尾", "content_1": "x"',
+    '以下是结果：{"wrong": true, "annotation": "前后有说明文字", "content_1": "改后"} 请参考。',
+    '说明 {不是JSON} 结尾 }',
+    '} 先出现右括号，后面才有 {',
+    '[{"wrong": false}]',
+    '"只是一个字符串"',
+    '42',
+    'null',
+    '错别字：“帐号”应为“账号”\n建议：统一使用“账号”。',
+    '"以经"应该是"已经"，请修改。',
+    '句中"做为"是错别字，应为"作为"。',
+    '经检查，原句无误。',
+    'THE SENTENCE IS FINE',
+    '建议：把逗号改为句号',
+    '错别字:无\n建议:无',
+    '',
+    '   ',
+    '```json\n```',
+]
+
+# ---- app.py 原有实现（去掉日志），作为对比基准 ----
+
+def legacy_strip_code_fence(content):
+    content = content.strip()
+    if content.startswith("```json"):
+        content = content[7:]
+    elif content.startswith("```"):
+        content = content[3:]
+    if content.endswith("```"):
+        content = content[:-3]
+    return content.strip()
+
+def legacy_build_check_result(json_content):
+    is_wrong = json_content.get("wrong", False)
+    return {
+        "wrong": is_wrong,
+        "annotation": json_content.get("annotation", "") if is_wrong else "无",
+        "content_1": json_content.get("content_1", "") if is_wrong else "无"
+    }
+
+def legacy_process_text_content(content):
+    no_error_keywords = ["没有错别字", "无错别字", "无错误", "无拼写错误", "无需修改", "无误", "准确", "正确"]
+    if any(phrase in content.lower() for phrase in no_error_keywords):
+        return json.dumps({"annotation": "无", "content_1": "无"}, ensure_ascii=False)
+    error_match = re.search(r'错别字[:：](.*?)(?:建议[:：]|$)', content, re.DOTALL)
+    if not error_match:
+        typo_match = re.search(r'[""「](.+?)[""」]\s*应(?:该)?[为是]\s*[""「](.+?)[""」]', content)
+        if typo_match:
+            old_word, correct_word = typo_match.group(1), typo_match.group(2)
+            error = f'"{old_word}" 应改为 "{correct_word}"'
+            return json.dumps({"annotation": error, "content_1": content}, ensure_ascii=False)
+    suggestion_match = re.search(r'建议[:：](.*?)$', content, re.DOTALL)
+    error = error_match.group(1).strip() if error_match else "无"
+    suggestion = suggestion_match.group(1).strip() if suggestion_match else "无"
+    if error == "无" and ("错别字" in content or "应为" in content or "应改为" in content):
+        alt_match = re.search(r'[""「](.+?)[""」].*?错别字.*?应(?:该)?[为是]\s*[""「](.+?)[""」]', content, re.DOTALL)
+        if alt_match:
+            old_word, correct_word = alt_match.group(1), alt_match.group(2)
+            error = f'"{old_word}" 应改为 "{correct_word}"'
+    if error == "无" and suggestion == "无":
+        result = {"annotation": "无", "content_1": content}
+    else:
+        result = {"annotation": error, "content_1": suggestion}
+    return json.dumps(result, ensure_ascii=False)
+
+def legacy_parse(content):
+    try:
+        content = legacy_strip_code_fence(content)
+        try:
+            json_content = json.loads(content)
+            result = legacy_build_check_result(json_content)
+            return json.dumps(result, ensure_ascii=False)
+        except json.JSONDecodeError:
+            try:
+                json_match = re.search(r'\{.*\}', content, re.DOTALL)
+                if json_match:
+                    json_content = json.loads(json_match.group(0))
+                    result = legacy_build_check_result(json_content)
+                    return json.dumps(result, ensure_ascii=False)
+                else:
+                    return legacy_process_text_content(content)
+            except Exception:
+                return legacy_process_text_content(content)
+    except Exception as e:
+        return json.dumps({"wrong": False, "annotation": f"处理API响应时出错: {str(e)}", "content_1": "请联系管理员"})
+
+def fast_parse(content):
+    """与 app._process_successful_response_new 中的调用方式一致"""
+    try:
+        return parse_check_reply(strip_code_fence(content))
+    except Exception as e:
+        return json.dumps({"wrong": False, "annotation": f"处理API响应时出错: {str(e)}", "content_1": "请联系管理员"})
+
+def categorize(reply):
+    content = legacy_strip_code_fence(reply)
+    try:
+        json.loads(content)
+        return 'fenced_json' if content != reply.strip() else 'json'
+    except ValueError:
+        pass
+    return 'embedded_json' if re.search(r'\{.*\}', content, re.DOTALL) else 'text'
+
+def check(replies):
+    """逐条比较新旧输出，返回不一致的条目"""
+    mismatches = []
+    for reply in replies:
+        expected, actual = legacy_parse(reply), fast_parse(reply)
+        if expected != actual:
+            mismatches.append((reply, expected, actual))
+    return mismatches
+
+def bench(name, func, replies, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for reply in replies:
+            func(reply)
+        best = min(best, time.perf_counter() - start)
+    per_reply = best / len(replies) * 1e6
+    print(f"  {name:<8} {best * 1000:9.2f} ms  {per_reply:8.1f} us/条")
+    return best
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='回复解析的回归检查和性能基准')
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    # 日志写入不计入解析耗时
+    logging.disable(logging.CRITICAL)
+
+    corpus = [entry['reply'] for entry in load_corpus(args.corpus)] if os.path.exists(args.corpus) else []
+    replies = corpus + SYNTHETIC_REPLIES
+    print(f"语料: {len(corpus)} 条日志回复 + {len(SYNTHETIC_REPLIES)} 条构造样例")
+
+    mismatches = check(replies)
+    for reply, expected, actual in mismatches:
+        print(f"输出不一致:\n  回复: {reply!r}\n  原实现: {expected}\n  新实现: {actual}")
+    if mismatches:
+        return 1
+    print("新旧输出完全一致")
+
+    groups = {}
+    for reply in replies:
+        groups.setdefault(categorize(reply), []).append(reply)
+    groups['all'] = replies
+    for group, items in groups.items():
+        print(f"\n{group}（{len(items)} 条）")
+        legacy = bench('legacy', legacy_parse, items, args.repeat)
+        fast = bench('fast', fast_parse, items, args.repeat)
+        print(f"  加速 {legacy / fast:.2f}x")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
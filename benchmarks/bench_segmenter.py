@@ -0,0 +1,88 @@
+"""分句性能基准：对比逐字符拼接的旧实现与 segmenter.split_sentences
+
+用法：python benchmarks/bench_segmenter.py [文本大小MB]
+"""
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from segmenter import split_sentences
+
+SAMPLE_SENTENCES = [
+    "患者于2025年5月17日入院，体温36.5℃。",
+    "医生说：“请按时服药。”",
+    "检查结果未见明显异常……",
+    "是否需要复查？！",
+    "详见 www.example.com 网站说明.",
+    "第3页 共12页",
+    "科室：心血管内科 主治医师：张三",
+]
+
+def legacy_split(text_content):
+    """app.py / worker.py 原有的逐字符分句实现"""
+    sentences = []
+    current_sentence = ""
+    for char in text_content:
+        current_sentence += char
+        if char in ['。', '！', '？', '…', '.', '!', '?']:
+            if current_sentence.strip():
+                sentences.append(current_sentence.strip())
+            current_sentence = ""
+    if current_sentence.strip():
+        sentences.append(current_sentence.strip())
+    return sentences
+
+def make_text(size_mb):
+    random.seed(0)
+    parts = []
+    total = 0
+    target = int(size_mb * 1024 * 1024 / 3)  # 中文字符按UTF-8约3字节计
+    while total < target:
+        sentence = random.choice(SAMPLE_SENTENCES)
+        parts.append(sentence)
+        parts.append(random.choice(['', '\n', ' ']))
+        total += len(sentence) + 1
+    return ''.join(parts)
+
+def make_unpunctuated_text(size_mb, sentence_chars=20000):
+    """表格、名单类OCR结果：很长一段才出现一个句末标点，旧实现在这种情况下退化为平方复杂度"""
+    random.seed(0)
+    chars = '科室医师患者病历检查报告日期姓名编号'
+    total = int(size_mb * 1024 * 1024 / 3)
+    parts = []
+    for start in range(0, total, sentence_chars):
+        parts.append(''.join(random.choice(chars) for _ in range(min(sentence_chars, total - start))))
+        parts.append('。')
+    return ''.join(parts)
+
+def bench(name, func, text, repeat=3):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(text)
+        best = min(best, time.perf_counter() - start)
+    print(f"{name:<16} {best * 1000:10.1f} ms  {len(result):8d} 句  {len(text) / best / 1e6:8.2f} M字符/秒")
+    return result
+
+def main():
+    size_mb = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    text = make_text(size_mb)
+    print(f"文本长度: {len(text)} 字符（约 {size_mb} MB）")
+    bench('legacy_split', legacy_split, text)
+    spans = bench('split_sentences', split_sentences, text)
+    
+    # 校验偏移量
+    assert all(text[span.start:span.end] == span.text for span in spans)
+    print("偏移量校验通过")
+    
+    text = make_unpunctuated_text(size_mb)
+    print(f"\n长句文本: {len(text)} 字符")
+    bench('legacy_split', legacy_split, text)
+    bench('split_sentences', split_sentences, text)
+
+if __name__ == '__main__':
+    main()
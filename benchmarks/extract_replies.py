@@ -0,0 +1,102 @@
+"""从应用日志中提取单句检查的“助手回复”，生成回复解析的测试语料
+
+用法：python benchmarks/extract_replies.py [日志文件...] [--output 语料文件]
+
+同时支持两种日志格式：旧版的文本日志（一条记录可能跨多行）和现在的JSON行日志，
+同一个文件中两种格式混合也可以。默认读取 app.log 和各worker进程的 app.<进程号>.log，
+写入 benchmarks/corpus/replies.jsonl，每行一条 {"reply": 回复原文, "source": "文件:行号"}，
+内容相同的回复只保留一条，日志中被截断的回复跳过。
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CORPUS = os.path.join(ROOT, 'benchmarks', 'corpus', 'replies.jsonl')
+
+REPLY_PREFIX = '助手回复: '
+
+# logging_setup.sample_body 截断后追加的标记
+_TRUNCATED_RE = re.compile(r'\.\.\.\(共\d+字符\)$')
+
+# 旧版文本日志的记录开头：时间 - 模块 - 级别 - 消息
+_TEXT_RECORD_RE = re.compile(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3} - \S+ - [A-Z]+ - (.*)$')
+
+def _json_record(line):
+    """JSON行日志的记录返回消息文本，其他行返回None"""
+    if not line.startswith('{'):
+        return None
+    try:
+        entry = json.loads(line)
+    except ValueError:
+        return None
+    if isinstance(entry, dict) and 'message' in entry and 'level' in entry:
+        return entry['message']
+    return None
+
+def iter_messages(path):
+    """逐条返回 (起始行号, 消息)，文本日志中跨行的消息合并为一条"""
+    current = None  # [起始行号, 各行]
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for number, line in enumerate(f, 1):
+            line = line.rstrip('\r\n')
+            message = _json_record(line)
+            if message is not None:
+                if current:
+                    yield current[0], '\n'.join(current[1])
+                    current = None
+                yield number, message
+                continue
+            match = _TEXT_RECORD_RE.match(line)
+            if match:
+                if current:
+                    yield current[0], '\n'.join(current[1])
+                current = [number, [match.group(1)]]
+            elif current:
+                # 多行消息的后续行
+                current[1].append(line)
+    if current:
+        yield current[0], '\n'.join(current[1])
+
+def extract(paths, keep_duplicates=False):
+    """返回语料条目列表"""
+    entries = []
+    seen = set()
+    for path in paths:
+        for number, message in iter_messages(path):
+            if not message.startswith(REPLY_PREFIX):
+                continue
+            reply = message[len(REPLY_PREFIX):]
+            if _TRUNCATED_RE.search(reply):
+                continue
+            if not keep_duplicates:
+                if reply in seen:
+                    continue
+                seen.add(reply)
+            entries.append({'reply': reply, 'source': f"{os.path.basename(path)}:{number}"})
+    return entries
+
+def load_corpus(path=DEFAULT_CORPUS):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='从日志中提取助手回复语料')
+    parser.add_argument('logs', nargs='*',
+                        default=[os.path.join(ROOT, 'app.log')] + sorted(glob.glob(os.path.join(ROOT, 'app.*.log'))))
+    parser.add_argument('--output', default=DEFAULT_CORPUS)
+    parser.add_argument('--keep-duplicates', action='store_true')
+    args = parser.parse_args(argv)
+
+    entries = extract(args.logs, args.keep_duplicates)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8', newline='\n') as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    print(f"提取 {len(entries)} 条回复 -> {args.output}")
+
+if __name__ == '__main__':
+    sys.exit(main())
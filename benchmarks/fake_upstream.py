@@ -0,0 +1,323 @@
+"""本地模拟的Kimi文件OCR和DeepSeek对话接口，用于离线压测
+
+用法：python benchmarks/fake_upstream.py [--ocr-port 8901] [--llm-port 8902] [选项]
+
+启动后把配置中的 kimi_upload_url 改为 http://127.0.0.1:8901/v1/files，
+api2_url 改为 http://127.0.0.1:8902/chat/completions，密钥随意填写。
+
+两个服务使用不同端口，应用中的自适应限流和指标按主机分别统计，与线上一致。
+延迟分布写法：fixed:200、uniform:100,500、lognormal:300,0.6（中位数毫秒,sigma）、
+exp:200（均值毫秒）。GET /_stats 返回各接口的调用次数和状态码，POST /_reset 清零。
+"""
+import argparse
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SAMPLE_SENTENCES = [
+    "患者于{n}日入院，体温36.{d}℃。",
+    "医生说：“请按时服药，{n}天后复查。”",
+    "检查结果未见明显异常，建议随访{n}个月。",
+    "科室：心血管内科 主治医师：张三 床号：{n}",
+    "第{d}页 共{n}页",
+    "本次巡检共发现问题{n}处，已全部整改完毕。",
+    "请于{n}月{d}日前提交整改报告！",
+    "是否需要再次复核？",
+]
+
+# 模拟错别字：正确词 -> 错误词
+TYPOS = [("检查", "检察"), ("复查", "附查"), ("整改", "正改"), ("提交", "题交"), ("报告", "报吿")]
+
+class LatencyModel:
+    """按分布描述生成延迟（秒）"""
+
+    def __init__(self, spec):
+        kind, _, params = spec.partition(':')
+        self.kind = kind
+        self.params = [float(value) for value in params.split(',') if value]
+        if kind not in ('fixed', 'uniform', 'lognormal', 'exp'):
+            raise ValueError(f"不支持的延迟分布: {spec}")
+
+    def sample(self):
+        p = self.params
+        if self.kind == 'fixed':
+            ms = p[0] if p else 0
+        elif self.kind == 'uniform':
+            ms = random.uniform(p[0], p[1])
+        elif self.kind == 'lognormal':
+            ms = random.lognormvariate(math.log(p[0]), p[1] if len(p) > 1 else 0.5)
+        else:
+            ms = random.expovariate(1 / p[0])
+        return max(ms, 0) / 1000
+
+class Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def add(self, endpoint, status):
+        with self._lock:
+            by_status = self._counts.setdefault(endpoint, {})
+            by_status[str(status)] = by_status.get(str(status), 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            return {endpoint: dict(by_status) for endpoint, by_status in self._counts.items()}
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+class FakeUpstream:
+    """两个服务共享的行为参数和统计"""
+
+    def __init__(self, args):
+        self.upload_latency = LatencyModel(args.upload_latency)
+        self.content_latency = LatencyModel(args.content_latency)
+        self.chat_latency = LatencyModel(args.chat_latency)
+        self.chat_item_ms = args.chat_item_ms
+        self.error_rate = args.error_rate
+        self.rate_limit_rate = args.rate_limit_rate
+        self.retry_after = args.retry_after
+        self.malformed_rate = args.malformed_rate
+        self.typo_rate = args.typo_rate
+        self.fence_rate = args.fence_rate
+        self.sentences = args.sentences
+        self.stats = {'ocr': Stats(), 'llm': Stats()}  # 每个服务的 /_stats 只统计自己的接口
+        self._files = {}
+        self._files_lock = threading.Lock()
+
+    def fault(self):
+        """按概率返回注入的错误状态码，不注入时返回None"""
+        roll = random.random()
+        if roll < self.rate_limit_rate:
+            return 429
+        if roll < self.rate_limit_rate + self.error_rate:
+            return random.choice((500, 502, 503))
+        return None
+
+    def make_text(self):
+        parts = []
+        for _ in range(max(1, int(random.gauss(self.sentences, self.sentences / 4)))):
+            sentence = random.choice(SAMPLE_SENTENCES).format(n=random.randint(1, 999), d=random.randint(1, 9))
+            if random.random() < self.typo_rate:
+                for right, wrong in TYPOS:
+                    if right in sentence:
+                        sentence = sentence.replace(right, wrong, 1)
+                        break
+            parts.append(sentence)
+            parts.append(random.choice(('', '\n')))
+        return ''.join(parts)
+
+    def add_file(self, filename):
+        file_id = uuid.uuid4().hex[:20]
+        with self._files_lock:
+            self._files[file_id] = (filename, self.make_text())
+        return file_id
+
+    def pop_file(self, file_id):
+        with self._files_lock:
+            return self._files.pop(file_id, None)
+
+    def check(self, sentence):
+        """模拟模型对一个句子的检查结果"""
+        for right, wrong in TYPOS:
+            if wrong in sentence:
+                return {
+                    "content_0": sentence,
+                    "wrong": True,
+                    "annotation": f'"{wrong}" 应改为 "{right}"',
+                    "content_1": sentence.replace(wrong, right)
+                }
+        return {"content_0": sentence, "wrong": False, "annotation": "", "content_1": ""}
+
+    def reply_content(self, user_content):
+        """根据用户消息生成助手回复文本：批量请求返回数组，单句返回对象"""
+        try:
+            items = json.loads(user_content) if user_content.lstrip().startswith('[') else None
+        except ValueError:
+            items = None
+        if isinstance(items, list):
+            payload = [dict(self.check(item.get('content_0', '')), index=item.get('index')) for item in items]
+        else:
+            payload = self.check(user_content)
+        content = json.dumps(payload, ensure_ascii=False, indent=2)
+        if random.random() < self.malformed_rate:
+            # 模型输出被截断
+            content = content[:max(1, len(content) * 2 // 3)]
+        if random.random() < self.fence_rate:
+            content = f"```json\n{content}\n```"
+        return content, (len(items) if isinstance(items, list) else 1)
+
+def make_handler(upstream, service):
+    stats = upstream.stats[service]
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, payload, headers=None):
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _read_body(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            return self.rfile.read(length) if length else b''
+
+        def _fault(self, endpoint):
+            status = upstream.fault()
+            if status is None:
+                return False
+            stats.add(endpoint, status)
+            headers = {'Retry-After': str(upstream.retry_after)} if status == 429 else None
+            message = 'rate limit reached' if status == 429 else 'upstream unavailable'
+            self._send_json(status, {"error": {"message": message, "type": "fake_fault"}}, headers)
+            return True
+
+        def do_GET(self):
+            if self.path == '/_stats':
+                return self._send_json(200, stats.snapshot())
+            match = re.fullmatch(r'/v1/files/([0-9a-f]+)/content', self.path)
+            if service != 'ocr' or not match:
+                return self._send_json(404, {"error": {"message": "not found"}})
+            time.sleep(upstream.content_latency.sample())
+            if self._fault('kimi_content'):
+                return
+            entry = upstream.pop_file(match.group(1))
+            if entry is None:
+                stats.add('kimi_content', 404)
+                return self._send_json(404, {"error": {"message": "file not found"}})
+            filename, text = entry
+            stats.add('kimi_content', 200)
+            self._send_json(200, {
+                "content": text,
+                "file_type": "application/octet-stream",
+                "filename": filename,
+                "title": "",
+                "type": "file"
+            })
+
+        def do_POST(self):
+            if self.path == '/_reset':
+                self._read_body()
+                stats.reset()
+                return self._send_json(200, {"success": True})
+            if service == 'ocr' and self.path == '/v1/files':
+                return self._upload()
+            if service == 'llm' and self.path.rstrip('/').endswith('/chat/completions'):
+                return self._chat()
+            self._read_body()
+            self._send_json(404, {"error": {"message": "not found"}})
+
+        def _upload(self):
+            body = self._read_body()
+            time.sleep(upstream.upload_latency.sample())
+            if self._fault('kimi_upload'):
+                return
+            match = re.search(rb'filename="([^"]*)"', body)
+            filename = match.group(1).decode('utf-8', 'replace') if match else 'upload'
+            file_id = upstream.add_file(filename)
+            stats.add('kimi_upload', 200)
+            self._send_json(200, {
+                "id": file_id,
+                "object": "file",
+                "bytes": len(body),
+                "created_at": int(time.time()),
+                "filename": filename,
+                "purpose": "file-extract",
+                "status": "ok"
+            })
+
+        def _chat(self):
+            try:
+                request_data = json.loads(self._read_body())
+                user_content = request_data['messages'][-1]['content']
+            except (ValueError, KeyError, IndexError, TypeError):
+                stats.add('chat', 400)
+                return self._send_json(400, {"error": {"message": "invalid request body"}})
+            content, items = upstream.reply_content(user_content)
+            # 批量请求的输出更长，耗时随句子数增加
+            time.sleep(upstream.chat_latency.sample() + upstream.chat_item_ms * (items - 1) / 1000)
+            if self._fault('chat'):
+                return
+            stats.add('chat', 200)
+            self._send_json(200, {
+                "id": uuid.uuid4().hex,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request_data.get('model', 'fake'),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop"
+                }],
+                "usage": {"prompt_tokens": len(user_content), "completion_tokens": len(content)}
+            })
+
+    return Handler
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='本地模拟的Kimi OCR和DeepSeek接口')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--ocr-port', type=int, default=8901)
+    parser.add_argument('--llm-port', type=int, default=8902)
+    parser.add_argument('--upload-latency', default='lognormal:400,0.4', help='上传文件的延迟分布')
+    parser.add_argument('--content-latency', default='lognormal:1500,0.5', help='获取识别结果的延迟分布')
+    parser.add_argument('--chat-latency', default='lognormal:800,0.5', help='文字检查请求的延迟分布')
+    parser.add_argument('--chat-item-ms', type=float, default=60, help='批量检查时每多一个句子增加的延迟（毫秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回5xx的比例')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='返回429的比例')
+    parser.add_argument('--retry-after', type=int, default=1, help='429响应中的Retry-After秒数')
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help='返回截断JSON的比例')
+    parser.add_argument('--typo-rate', type=float, default=0.1, help='识别结果中含错别字句子的比例')
+    parser.add_argument('--fence-rate', type=float, default=0.5, help='回复包在```json代码块中的比例')
+    parser.add_argument('--sentences', type=int, default=20, help='每张图片识别出的平均句子数')
+    parser.add_argument('--seed', type=int, default=None)
+    return parser.parse_args(argv)
+
+def start_servers(args):
+    """在后台线程中启动两个服务，返回 (FakeUpstream, [服务器])"""
+    if args.seed is not None:
+        random.seed(args.seed)
+    upstream = FakeUpstream(args)
+    servers = []
+    for service, port in (('ocr', args.ocr_port), ('llm', args.llm_port)):
+        server = ThreadingHTTPServer((args.host, port), make_handler(upstream, service))
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name=f'fake-{service}', daemon=True).start()
+        servers.append(server)
+    return upstream, servers
+
+def main(argv=None):
+    args = parse_args(argv)
+    upstream, servers = start_servers(args)
+    print(f"kimi_upload_url: http://{args.host}:{servers[0].server_port}/v1/files")
+    print(f"api2_url:        http://{args.host}:{servers[1].server_port}/chat/completions")
+    print("Ctrl+C 退出")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for server in servers:
+            server.shutdown()
+        summary = {service: stats.snapshot() for service, stats in upstream.stats.items()}
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,200 @@
+"""端到端压测：并发向运行中的应用提交图片（/upload + /process），统计吞吐量和延迟分位数
+
+用法：
+    python benchmarks/fake_upstream.py &
+    gunicorn -w 4 --threads 8 app:app &   # 配置指向模拟服务，见 fake_upstream.py
+    python benchmarks/load_test.py --images 200 --concurrency 16
+
+每张图片的内容都不同，避免OCR缓存命中；--same-image 时所有请求使用同一张图片，
+用于测量缓存命中路径。--output 把结果写成JSON，便于前后两次修改对比。
+"""
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from PIL import Image
+
+def make_image(width, height, seed):
+    """生成随机噪点PNG，每个seed内容不同"""
+    rng = random.Random(seed)
+    image = Image.frombytes('L', (width // 4, height // 4), rng.randbytes((width // 4) * (height // 4)))
+    image = image.resize((width, height))
+    output = io.BytesIO()
+    image.save(output, format='PNG')
+    return output.getvalue()
+
+def percentile(values, pct):
+    """最近秩法分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+def fetch_upstream_stats(urls):
+    stats = {}
+    for url in urls:
+        try:
+            stats[url] = requests.get(url, timeout=5).json()
+        except (requests.RequestException, ValueError):
+            stats[url] = None
+    return stats
+
+def reset_upstream_stats(urls):
+    for url in urls:
+        try:
+            requests.post(url.rsplit('/', 1)[0] + '/_reset', timeout=5)
+        except requests.RequestException:
+            pass
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.base_url = args.base_url.rstrip('/')
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.samples = []  # 每张图片一条：上传耗时、处理耗时、总耗时、句子数、是否成功、错误信息
+        self._same_image = make_image(args.width, args.height, 0) if args.same_image else None
+        self._run_id = uuid.uuid4().hex
+
+    def _session(self):
+        # 每个线程一个会话，复用连接，并保持各自的浏览器会话cookie
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def run_one(self, index):
+        session = self._session()
+        image = self._same_image or make_image(self.args.width, self.args.height, f"{self._run_id}-{index}")
+        sample = {'index': index, 'success': False, 'sentences': 0, 'upload': None, 'process': None}
+        start = time.perf_counter()
+        try:
+            response = session.post(
+                f"{self.base_url}/upload",
+                files={'file': (f"load_{index}.png", image, 'image/png')},
+                timeout=self.args.timeout
+            )
+            uploaded = response.json()
+            sample['upload'] = time.perf_counter() - start
+            if not uploaded.get('success'):
+                raise RuntimeError(f"上传失败: {uploaded.get('message')}")
+
+            process_start = time.perf_counter()
+            response = session.post(
+                f"{self.base_url}/process",
+                json={'filepath': uploaded['filepath'], 'sha256': uploaded['sha256']},
+                timeout=self.args.timeout
+            )
+            result = response.json()
+            sample['process'] = time.perf_counter() - process_start
+            if not result.get('success'):
+                raise RuntimeError(f"处理失败: {result.get('message')}")
+            sample['sentences'] = len(result.get('sentences', []))
+            sample['success'] = True
+        except Exception as e:
+            sample['error'] = str(e)
+        sample['total'] = time.perf_counter() - start
+        with self._lock:
+            self.samples.append(sample)
+            done = len(self.samples)
+        if not self.args.quiet and done % max(1, self.args.images // 10) == 0:
+            print(f"  已完成 {done}/{self.args.images}", file=sys.stderr)
+        return sample
+
+    def warm_up(self):
+        """串行提交几张图片，建立连接、加载配置，不计入结果"""
+        for i in range(self.args.warmup):
+            self.run_one(-1 - i)
+        self.samples = []
+
+    def run(self):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.args.concurrency) as executor:
+            list(executor.map(self.run_one, range(self.args.images)))
+        return time.perf_counter() - start
+
+def summarize(samples, elapsed, upstream_stats):
+    ok = [s for s in samples if s['success']]
+
+    def latency(key):
+        values = [s[key] for s in ok if s[key] is not None]
+        return {
+            f'p{pct}_ms': round(percentile(values, pct) * 1000, 1) if values else None
+            for pct in (50, 95, 99)
+        }
+
+    errors = {}
+    for s in samples:
+        if not s['success']:
+            errors[s.get('error', '')] = errors.get(s.get('error', ''), 0) + 1
+    sentences = sum(s['sentences'] for s in ok)
+    return {
+        'images': len(samples),
+        'succeeded': len(ok),
+        'failed': len(samples) - len(ok),
+        'elapsed_s': round(elapsed, 2),
+        'images_per_s': round(len(ok) / elapsed, 3) if elapsed else None,
+        'sentences_per_s': round(sentences / elapsed, 2) if elapsed else None,
+        'total': latency('total'),
+        'upload': latency('upload'),
+        'process': latency('process'),
+        'errors': errors,
+        'upstream_calls': upstream_stats
+    }
+
+def print_report(report):
+    print(f"图片: {report['images']}  成功: {report['succeeded']}  失败: {report['failed']}  "
+          f"耗时: {report['elapsed_s']} 秒")
+    print(f"吞吐量: {report['images_per_s']} 张/秒  {report['sentences_per_s']} 句/秒")
+    for key, label in (('total', '总耗时'), ('upload', '上传'), ('process', '处理')):
+        values = report[key]
+        print(f"{label:<6} p50 {values['p50_ms']} ms  p95 {values['p95_ms']} ms  p99 {values['p99_ms']} ms")
+    for error, count in report['errors'].items():
+        print(f"错误 x{count}: {error}")
+    for url, stats in report['upstream_calls'].items():
+        print(f"上游调用 {url}: {json.dumps(stats, ensure_ascii=False)}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='端到端压测 /upload + /process')
+    parser.add_argument('--base-url', default='http://127.0.0.1:5000')
+    parser.add_argument('--images', type=int, default=50, help='提交的图片数')
+    parser.add_argument('--concurrency', type=int, default=8, help='并发请求数')
+    parser.add_argument('--warmup', type=int, default=1, help='正式开始前串行提交的图片数')
+    parser.add_argument('--width', type=int, default=1600)
+    parser.add_argument('--height', type=int, default=1200)
+    parser.add_argument('--same-image', action='store_true', help='所有请求使用同一张图片')
+    parser.add_argument('--timeout', type=float, default=300)
+    parser.add_argument('--upstream-stats', nargs='*',
+                        default=['http://127.0.0.1:8901/_stats', 'http://127.0.0.1:8902/_stats'],
+                        help='模拟服务的统计地址，开始前清零，结束后读取')
+    parser.add_argument('--output', help='把结果写入JSON文件')
+    parser.add_argument('--quiet', action='store_true')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    test = LoadTest(args)
+    test.warm_up()
+    # 预热请求产生的上游调用也不计入
+    reset_upstream_stats(args.upstream_stats)
+    elapsed = test.run()
+    report = summarize(test.samples, elapsed, fetch_upstream_stats(args.upstream_stats))
+    report['args'] = {key: value for key, value in vars(args).items() if key != 'upstream_stats'}
+    print_report(report)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0 if report['failed'] == 0 else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
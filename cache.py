@@ -0,0 +1,193 @@
+import atexit
+import hashlib
+import json
+import os
+import time
+import logging
+import threading
+from functools import lru_cache
+
+from db import get_connection
+
+logger = logging.getLogger(__name__)
+
+class DiskCache:
+    """基于SQLite的持久化缓存，多个worker进程共享
+
+    支持按TTL过期、按条目数做LRU淘汰，并记录命中/未命中次数。
+    命中时不写数据库：命中/未命中次数先在内存中累计，由后台线程定期写入；
+    最近访问时间只在距上次记录超过 touch_interval 秒时更新，LRU淘汰按这个粒度进行
+    """
+
+    # 每写入多少条检查一次是否需要淘汰
+    EVICT_INTERVAL = 200
+
+    def __init__(self, path, name, ttl=30 * 24 * 3600, max_entries=100000, flush_interval=5, touch_interval=3600):
+        self.path = path
+        self.name = name
+        self.table = f"cache_{name}"
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+        self.touch_interval = touch_interval
+        self._writes = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+        self._pid = None
+        self._init_db()
+
+    def _conn(self):
+        return get_connection(self.path)
+
+    def _init_db(self):
+        conn = self._conn()
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self.table} (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+        """)
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.table}_accessed ON {self.table} (accessed)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache_stats (
+                name TEXT PRIMARY KEY,
+                hits INTEGER NOT NULL DEFAULT 0,
+                misses INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        conn.execute("INSERT OR IGNORE INTO cache_stats (name) VALUES (?)", (self.name,))
+
+    def get(self, key):
+        """读取缓存，未命中或已过期返回None"""
+        try:
+            conn = self._conn()
+            now = time.time()
+            row = conn.execute(
+                f"SELECT value, created, accessed FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            
+            if row is None or (self.ttl and now - row[1] > self.ttl):
+                if row is not None:
+                    conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self._count(misses=1)
+                return None
+            
+            if now - row[2] > self.touch_interval:
+                conn.execute(f"UPDATE {self.table} SET accessed = ? WHERE key = ?", (now, key))
+            self._count(hits=1)
+            return row[0]
+        except Exception as e:
+            # 缓存不可用时不影响主流程
+            logger.warning(f"读取缓存失败({self.name}): {str(e)}")
+            return None
+
+    def _count(self, hits=0, misses=0):
+        self._ensure_started()
+        with self._lock:
+            self._hits += hits
+            self._misses += misses
+
+    def _ensure_started(self):
+        # fork出的子进程需要重新启动写入线程，继承来的计数由父进程写入
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            self._pid = pid
+            self._hits = self._misses = 0
+            threading.Thread(target=self._flush_loop, name=f'cache-stats-{self.name}', daemon=True).start()
+            atexit.register(self._flush_at_exit)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush_stats()
+            except Exception as e:
+                logger.warning(f"写入缓存统计失败({self.name}): {str(e)}")
+
+    def _flush_at_exit(self):
+        if self._pid == os.getpid():
+            try:
+                self.flush_stats()
+            except Exception:
+                pass
+
+    def flush_stats(self):
+        """把本进程累计的命中/未命中次数写入SQLite"""
+        with self._lock:
+            hits, misses = self._hits, self._misses
+            self._hits = self._misses = 0
+        if not hits and not misses:
+            return
+        try:
+            self._conn().execute(
+                "UPDATE cache_stats SET hits = hits + ?, misses = misses + ? WHERE name = ?",
+                (hits, misses, self.name)
+            )
+        except Exception:
+            # 写入失败时放回，下次再写
+            with self._lock:
+                self._hits += hits
+                self._misses += misses
+            raise
+
+    def set(self, key, value):
+        """写入缓存"""
+        try:
+            now = time.time()
+            self._conn().execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            self._writes += 1
+            if self._writes % self.EVICT_INTERVAL == 0:
+                self.evict()
+        except Exception as e:
+            logger.warning(f"写入缓存失败({self.name}): {str(e)}")
+
+    def evict(self):
+        """删除过期条目，并按最近访问时间淘汰超出上限的条目"""
+        conn = self._conn()
+        if self.ttl:
+            conn.execute(f"DELETE FROM {self.table} WHERE created < ?", (time.time() - self.ttl,))
+        if self.max_entries:
+            conn.execute(f"""
+                DELETE FROM {self.table} WHERE key IN (
+                    SELECT key FROM {self.table} ORDER BY accessed DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+
+    def stats(self):
+        """返回命中/未命中次数和当前条目数（其他进程尚未写入的次数不计）"""
+        self.flush_stats()
+        conn = self._conn()
+        hits, misses = conn.execute(
+            "SELECT hits, misses FROM cache_stats WHERE name = ?", (self.name,)
+        ).fetchone()
+        entries = conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / total, 4) if total else 0.0,
+            'entries': entries
+        }
+
+@lru_cache(maxsize=32)
+def _prompt_hash(system_prompt):
+    """系统提示词较长且很少变化，哈希值只计算一次"""
+    return hashlib.sha256(system_prompt.encode('utf-8')).hexdigest()
+
+def sentence_cache_key(model, system_prompt, sentence):
+    """按 (模型, 系统提示词哈希, 归一化句子) 生成缓存键"""
+    prompt_hash = _prompt_hash(system_prompt)
+    # 归一化：合并连续空白
+    normalized = ' '.join(sentence.split())
+    raw = json.dumps([model, prompt_hash, normalized], ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
@@ -0,0 +1,113 @@
+import json
+import os
+import tempfile
+import threading
+import logging
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+class ConfigStore:
+    """config.json 的内存副本
+
+    读取时只检查文件的修改时间，文件变化后才重新解析；写入时先写临时文件再
+    原子替换，其他worker进程读到的总是完整的配置
+    """
+
+    def __init__(self, path, defaults):
+        self.path = path
+        self.defaults = defaults
+        self._lock = threading.Lock()
+        self._config = None
+        self._stamp = None
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def get(self):
+        """返回当前配置的副本，调用方可以自由修改"""
+        stamp = self._file_stamp()
+        if stamp is None or stamp != self._stamp:
+            self._reload(stamp)
+        return dict(self._config)
+
+    def _reload(self, stamp):
+        with self._lock:
+            if stamp is not None and stamp == self._stamp:
+                return
+            if stamp is None:
+                # 配置文件不存在时写入默认配置
+                self._write(self.defaults)
+                return
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._config = json.load(f)
+                self._stamp = stamp
+                logger.info(f"已加载配置文件: {self.path}")
+            except (OSError, ValueError) as e:
+                if self._config is None:
+                    raise
+                # 文件正在被手动编辑等情况，继续使用上一份有效配置
+                logger.error(f"读取配置文件失败，继续使用当前配置: {str(e)}")
+
+    def save(self, config):
+        """原子写入配置文件并立即生效"""
+        with self._lock:
+            self._write(config)
+
+    def _write(self, config):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(prefix='.config-', suffix='.json', dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(config, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+        self._config = dict(config)
+        self._stamp = self._file_stamp()
+
+class ChatTemplate:
+    """预先构建好的对话请求模板
+
+    请求头和含系统提示词的请求体前缀只构建一次，发送时只需序列化用户消息
+    """
+
+    def __init__(self, api_url, api_key, model, system_prompt):
+        self.api_url = api_url
+        self.model = model
+        self.system_prompt = system_prompt
+        self.headers = {
+            "Content-Type": "application/json; charset=utf-8",
+            "Authorization": f"Bearer {api_key}"
+        }
+
+        # 与 json.dumps(请求体字典, ensure_ascii=False) 的输出逐字节一致
+        prefix = {
+            "model": model,
+            "messages": [{"role": "system", "content": system_prompt}, {"role": "user", "content": None}]
+        }
+        serialized = json.dumps(prefix, ensure_ascii=False)
+        self._prefix = serialized[:-len('null}]}')].encode('utf-8')
+
+    def body(self, user_content, max_tokens):
+        """构建完整的请求体字节串"""
+        return b''.join((
+            self._prefix,
+            json.dumps(user_content, ensure_ascii=False).encode('utf-8'),
+            b'}], "stream": false, "max_tokens": ',
+            str(int(max_tokens)).encode('ascii'),
+            b'}'
+        ))
+
+@lru_cache(maxsize=32)
+def chat_template(api_url, api_key, model, system_prompt):
+    """按 (地址, 密钥, 模型, 系统提示词) 缓存请求模板，配置修改后自动使用新模板"""
+    return ChatTemplate(api_url, api_key, model, system_prompt)
@@ -0,0 +1,28 @@
+import os
+import sqlite3
+import threading
+
+# 每个线程各自持有连接，fork出的子进程（如gunicorn worker）重新建立连接
+_local = threading.local()
+
+def get_connection(path):
+    """获取当前线程到指定SQLite数据库的连接
+
+    数据库使用WAL模式，多个gunicorn worker进程可以同时读写同一个文件
+    """
+    pid = os.getpid()
+    if getattr(_local, 'pid', None) != pid:
+        _local.pid = pid
+        _local.connections = {}
+    
+    conn = _local.connections.get(path)
+    if conn is None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # isolation_level=None 为自动提交模式，需要事务时显式 BEGIN
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        _local.connections[path] = conn
+    return conn
@@ -0,0 +1,98 @@
+import os
+import threading
+import logging
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    # 可选依赖：安装 httpx[http2] 后可启用HTTP/2多路复用
+    import httpx
+except ImportError:
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+# 默认超时：(连接超时, 读取超时)，单位秒
+DEFAULT_TIMEOUT = (10, 120)
+
+_settings = {
+    'pool_maxsize': 32,  # 每个上游主机的最大连接数
+    'http2': False
+}
+_clients = {}
+_lock = threading.Lock()
+
+def configure(pool_maxsize=None, http2=None):
+    """设置连接池参数，需在首次请求前调用"""
+    with _lock:
+        if pool_maxsize:
+            _settings['pool_maxsize'] = int(pool_maxsize)
+        if http2 is not None:
+            if http2 and httpx is None:
+                logger.warning("未安装httpx，HTTP/2不可用，使用requests连接池")
+            _settings['http2'] = bool(http2) and httpx is not None
+        _clients.clear()
+
+def _create_client():
+    if _settings['http2']:
+        return httpx.Client(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=_settings['pool_maxsize'],
+                max_keepalive_connections=_settings['pool_maxsize']
+            ),
+            timeout=httpx.Timeout(DEFAULT_TIMEOUT[1], connect=DEFAULT_TIMEOUT[0])
+        )
+    
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=_settings['pool_maxsize'])
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def _get_client(url):
+    """获取上游主机对应的客户端，每个进程、每个主机各自持有一个连接池"""
+    parts = urlsplit(url)
+    key = (os.getpid(), parts.scheme, parts.netloc)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = _create_client()
+    return client
+
+def request(method, url, **kwargs):
+    """通过共享连接池发送请求，返回的响应对象兼容 requests.Response 的常用属性"""
+    client = _get_client(url)
+    if httpx is not None and isinstance(client, httpx.Client):
+        # httpx 使用 content 传递原始字节
+        if isinstance(kwargs.get('data'), (bytes, str)):
+            kwargs['content'] = kwargs.pop('data')
+        return client.request(method, url, **kwargs)
+    
+    kwargs.setdefault('timeout', DEFAULT_TIMEOUT)
+    return client.request(method, url, **kwargs)
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+def warm_up(urls):
+    """在后台预先建立到各上游主机的连接（DNS、TCP、TLS握手）"""
+    def _warm():
+        for url in urls:
+            if not url:
+                continue
+            try:
+                parts = urlsplit(url)
+                request('HEAD', f"{parts.scheme}://{parts.netloc}/", timeout=5)
+                logger.info(f"连接预热完成: {parts.netloc}")
+            except Exception as e:
+                logger.warning(f"连接预热失败({url}): {str(e)}")
+    
+    threading.Thread(target=_warm, name='http-warm-up', daemon=True).start()
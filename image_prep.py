@@ -0,0 +1,85 @@
+import io
+import os
+import time
+import logging
+
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# 逐步降低的JPEG质量，仍超出字节预算时再缩小尺寸
+_QUALITY_STEPS = (85, 75, 65, 55)
+_SHRINK_RATIO = 0.75
+_MIN_SIDE = 640
+
+def prepare_image(path, max_side=2048, max_bytes=1536 * 1024, grayscale=True):
+    """压缩图片以减少OCR上传量，返回 (文件名, 图片字节)
+
+    JPEG使用draft模式按目标尺寸直接解码，按EXIF方向摆正后转灰度、缩小尺寸，
+    再重新编码为JPEG并控制在 max_bytes 以内；原图已经足够小时直接使用原图
+    """
+    started = time.perf_counter()
+    filename = os.path.basename(path)
+    with open(path, 'rb') as file:
+        raw_bytes = file.read()
+
+    try:
+        image = Image.open(io.BytesIO(raw_bytes))
+        source_format = image.format
+        source_size = image.size
+        orientation = image.getexif().get(0x0112, 1)
+
+        # 原图尺寸、大小都在范围内且不需要摆正方向时不再重新编码
+        if (len(raw_bytes) <= max_bytes and max(source_size) <= max_side and orientation == 1
+                and source_format in ('JPEG', 'PNG') and not grayscale):
+            logger.info(f"图片预处理: {filename} 无需压缩, {len(raw_bytes)} 字节")
+            return filename, raw_bytes
+
+        if source_format == 'JPEG':
+            # 只解码到不小于目标尺寸的缩放级别，大图解码快很多
+            image.draft('L' if grayscale else 'RGB', (max_side, max_side))
+        image = ImageOps.exif_transpose(image)
+        image = _convert_mode(image, grayscale)
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+
+        image, data = _encode_within_budget(image, max_bytes)
+        output_size = image.size
+        if (len(data) >= len(raw_bytes) and len(raw_bytes) <= max_bytes
+                and max(source_size) <= max_side and orientation == 1):
+            # 重新编码反而更大时保留原图
+            data = raw_bytes
+            output_size = source_size
+        else:
+            filename = os.path.splitext(filename)[0] + '.jpg'
+
+        logger.info(
+            f"图片预处理: {filename} {source_format} {source_size[0]}x{source_size[1]} -> "
+            f"{output_size[0]}x{output_size[1]}, {len(raw_bytes)} -> {len(data)} 字节, "
+            f"耗时 {(time.perf_counter() - started) * 1000:.0f}ms"
+        )
+        return filename, data
+    except Exception as e:
+        logger.warning(f"图片预处理失败，上传原图: {str(e)}")
+        return os.path.basename(path), raw_bytes
+
+def _convert_mode(image, grayscale):
+    """透明背景铺白后转为灰度或RGB"""
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGBA', image.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, image)
+    return image.convert('L' if grayscale else 'RGB')
+
+def _encode_within_budget(image, max_bytes):
+    """依次降低质量、缩小尺寸，直到编码结果不超过 max_bytes，返回 (图片, 字节)"""
+    while True:
+        for quality in _QUALITY_STEPS:
+            buffer = io.BytesIO()
+            image.save(buffer, format='JPEG', quality=quality, optimize=True)
+            data = buffer.getvalue()
+            if len(data) <= max_bytes:
+                return image, data
+        width, height = image.size
+        if min(width, height) * _SHRINK_RATIO < _MIN_SIDE:
+            return image, data
+        image = image.resize((int(width * _SHRINK_RATIO), int(height * _SHRINK_RATIO)), Image.LANCZOS)
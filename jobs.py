@@ -0,0 +1,192 @@
+import json
+import time
+import uuid
+import logging
+
+from db import get_connection
+
+logger = logging.getLogger(__name__)
+
+class JobStore:
+    """后台任务状态存储，基于SQLite，所有worker进程共享
+
+    任一worker提交的任务都可以在其他worker上查询进度和已完成的句子
+    """
+
+    def __init__(self, path, ttl=24 * 3600):
+        self.path = path
+        self.ttl = ttl  # 任务记录保留时间（秒）
+        self._init_db()
+
+    def _conn(self):
+        return get_connection(self.path)
+
+    def _init_db(self):
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                batch_id TEXT,
+                filename TEXT,
+                status TEXT NOT NULL,
+                total INTEGER NOT NULL DEFAULT 0,
+                done INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                wrong INTEGER,
+                message TEXT,
+                created REAL NOT NULL,
+                updated REAL NOT NULL
+            )
+        """)
+        # 兼容早期没有批次字段的数据库
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(jobs)")]
+        if 'batch_id' not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN batch_id TEXT")
+            conn.execute("ALTER TABLE jobs ADD COLUMN filename TEXT")
+        if 'wrong' not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN wrong INTEGER")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_batch ON jobs (batch_id)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS job_sentences (
+                job_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (job_id, idx)
+            )
+        """)
+
+    def create(self, batch_id=None, filename=None):
+        """创建排队中的任务，返回任务ID"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO jobs (id, batch_id, filename, status, created, updated) VALUES (?, ?, ?, 'queued', ?, ?)",
+            (job_id, batch_id, filename, now, now)
+        )
+        self.purge()
+        return job_id
+
+    def start(self, job_id):
+        self._conn().execute(
+            "UPDATE jobs SET status = 'running', updated = ? WHERE id = ?", (time.time(), job_id)
+        )
+
+    def add_sentence(self, job_id, index, total, sentence_result):
+        """记录一句已完成的检查结果"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO job_sentences (job_id, idx, data) VALUES (?, ?, ?)",
+                (job_id, index, json.dumps(sentence_result, ensure_ascii=False))
+            )
+            conn.execute(
+                "UPDATE jobs SET total = ?, done = done + 1, updated = ? WHERE id = ?",
+                (total, time.time(), job_id)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def finish(self, job_id, result):
+        # 有错别字的句子数单独保存，查询批次状态时不需要读取完整结果
+        wrong = sum(1 for row in result.get('sentences', []) if row.get('错别字'))
+        self._conn().execute(
+            "UPDATE jobs SET status = 'done', done = total, result = ?, wrong = ?, updated = ? WHERE id = ?",
+            (json.dumps(result, ensure_ascii=False), wrong, time.time(), job_id)
+        )
+
+    def fail(self, job_id, message):
+        self._conn().execute(
+            "UPDATE jobs SET status = 'failed', message = ?, updated = ? WHERE id = ?",
+            (message, time.time(), job_id)
+        )
+
+    def get(self, job_id):
+        """查询任务状态，不存在时返回None"""
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT status, total, done, result, message, created, updated FROM jobs WHERE id = ?",
+            (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        
+        status, total, done, result, message, created, updated = row
+        if status == 'done':
+            progress = 100
+        else:
+            progress = int(done * 100 / total) if total else 0
+        
+        job = {
+            'job_id': job_id,
+            'status': status,
+            'progress': progress,
+            'total': total,
+            'done': done,
+            'created': created,
+            'updated': updated
+        }
+        if result is not None:
+            job.update(json.loads(result))
+        else:
+            # 任务未完成时返回已检查完的句子
+            rows = conn.execute(
+                "SELECT data FROM job_sentences WHERE job_id = ? ORDER BY idx", (job_id,)
+            ).fetchall()
+            job['sentences'] = [json.loads(data) for (data,) in rows]
+        if message:
+            job['message'] = message
+        return job
+
+    def get_batch(self, batch_id):
+        """汇总批次内所有任务的状态，批次不存在时返回None
+
+        只返回每个任务的状态、进度和句子数，句子明细通过 get 按任务查询
+        """
+        rows = self._conn().execute(
+            "SELECT id, filename, status, total, done, wrong, message, created, updated "
+            "FROM jobs WHERE batch_id = ? ORDER BY created", (batch_id,)
+        ).fetchall()
+        if not rows:
+            return None
+        
+        counts = {'queued': 0, 'running': 0, 'done': 0, 'failed': 0}
+        jobs = []
+        for job_id, filename, status, total, done, wrong, message, created, updated in rows:
+            counts[status] = counts.get(status, 0) + 1
+            job = {
+                'job_id': job_id,
+                'filename': filename,
+                'status': status,
+                'progress': 100 if status == 'done' else (int(done * 100 / total) if total else 0),
+                'total': total,
+                'done': done,
+                'created': created,
+                'updated': updated
+            }
+            if wrong is not None:
+                job['wrong_count'] = wrong
+            if message:
+                job['message'] = message
+            jobs.append(job)
+        
+        finished = counts['done'] + counts['failed']
+        return {
+            'batch_id': batch_id,
+            'status': 'done' if finished == len(rows) else 'running',
+            'progress': int(sum(job['progress'] for job in jobs) / len(jobs)),
+            'counts': counts,
+            'jobs': jobs
+        }
+
+    def purge(self):
+        """清理过期的任务记录"""
+        conn = self._conn()
+        expired = time.time() - self.ttl
+        conn.execute(
+            "DELETE FROM job_sentences WHERE job_id IN (SELECT id FROM jobs WHERE updated < ?)", (expired,)
+        )
+        conn.execute("DELETE FROM jobs WHERE updated < ?", (expired,))
@@ -0,0 +1,213 @@
+import difflib
+import re
+import threading
+import time
+import logging
+
+from db import get_connection
+
+try:
+    # 可选依赖：安装 pyahocorasick 后使用C实现的自动机
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+logger = logging.getLogger(__name__)
+
+# 批注中的修改说明，如 "X" 应改为 "Y"、“X”应为“Y”
+_PAIR_RE = re.compile(r'["“「\'‘](.+?)["”」\'’]\s*应(?:该)?(?:改为|为|是)\s*["“「\'‘](.+?)["”」\'’]')
+# 只学习较短的词语替换，整句改写不适合作为固定搭配
+_MAX_WORD_CHARS = 8
+
+def extract_pairs(annotation, original=None, corrected=None):
+    """从检查结果中提取 (错误写法, 正确写法) 列表
+
+    优先解析批注中的“X应改为Y”，没有时比较原句和修改后的句子
+    """
+    pairs = [(wrong.strip(), right.strip()) for wrong, right in _PAIR_RE.findall(annotation or '')]
+    if not pairs and original and corrected and corrected != '无':
+        matcher = difflib.SequenceMatcher(None, original, corrected, autojunk=False)
+        replaces = [op for op in matcher.get_opcodes() if op[0] != 'equal']
+        # 只有一处替换时才能确定对应关系
+        if len(replaces) == 1 and replaces[0][0] == 'replace':
+            _, i1, i2, j1, j2 = replaces[0]
+            pairs = [(original[i1:i2], corrected[j1:j2])]
+    # 单个字的错误（如的/得）依赖上下文，不做固定匹配；也不带上相邻的字扩展成词，
+    # 否则“跑的→跑得”会误判“跑的路线”
+    return [
+        (wrong, right) for wrong, right in pairs
+        if wrong != right and 2 <= len(wrong) <= _MAX_WORD_CHARS and 0 < len(right) <= _MAX_WORD_CHARS
+    ]
+
+class _Automaton:
+    """纯Python实现的Aho-Corasick自动机，未安装pyahocorasick时使用"""
+
+    def __init__(self, words):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [None]
+        for word, value in words.items():
+            state = 0
+            for char in word:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(None)
+                state = next_state
+            self.output[state] = (word, value)
+
+        # 按层构建失败指针，同时把失败状态上的输出合并进来
+        self.outputs = [[out] if out else [] for out in self.output]
+        queue = list(self.goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[next_state] = target if target != next_state else 0
+                self.outputs[next_state] = self.outputs[next_state] + self.outputs[self.fail[next_state]]
+
+    def iter(self, text):
+        """依次返回 (结束位置, (词, 值))"""
+        goto, fail, outputs = self.goto, self.fail, self.outputs
+        state = 0
+        for end, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for out in outputs[state]:
+                yield end, out
+
+def _build_automaton(words):
+    if ahocorasick is not None:
+        automaton = ahocorasick.Automaton()
+        for word, value in words.items():
+            automaton.add_word(word, (word, value))
+        automaton.make_automaton()
+        return automaton
+    return _Automaton(words)
+
+class KnownErrorDictionary:
+    """从模型确认过的修改中学习的错别字词典，多个worker进程共享
+
+    同一修改被确认 min_hits 次后才参与匹配，匹配使用Aho-Corasick自动机，
+    词典有变化时各进程在 refresh_interval 秒内重新编译
+    """
+
+    def __init__(self, path, min_hits=2, refresh_interval=10):
+        self.path = path
+        self.min_hits = min_hits
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._automaton = None
+        self._signature = None
+        self._checked = 0
+        self._init_db()
+
+    def _conn(self):
+        return get_connection(self.path)
+
+    def _init_db(self):
+        self._conn().execute("""
+            CREATE TABLE IF NOT EXISTS known_errors (
+                wrong TEXT NOT NULL,
+                correct TEXT NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                updated REAL NOT NULL,
+                PRIMARY KEY (wrong, correct)
+            )
+        """)
+
+    def learn(self, annotation, original=None, corrected=None):
+        """记录一次模型确认的修改，返回学到的 (错误写法, 正确写法) 列表"""
+        pairs = extract_pairs(annotation, original, corrected)
+        if not pairs:
+            return []
+        try:
+            now = time.time()
+            self._conn().executemany("""
+                INSERT INTO known_errors (wrong, correct, hits, updated) VALUES (?, ?, 1, ?)
+                ON CONFLICT (wrong, correct) DO UPDATE SET hits = hits + 1, updated = excluded.updated
+            """, [(wrong, right, now) for wrong, right in pairs])
+        except Exception as e:
+            logger.error(f"写入错别字词典出错: {str(e)}")
+            return []
+        return pairs
+
+    def _refresh(self):
+        """词典有变化时重新编译自动机"""
+        now = time.time()
+        if self._automaton is not None and now - self._checked < self.refresh_interval:
+            return self._automaton
+        with self._lock:
+            if self._automaton is not None and now - self._checked < self.refresh_interval:
+                return self._automaton
+            conn = self._conn()
+            signature = conn.execute(
+                "SELECT COUNT(*), MAX(updated) FROM known_errors WHERE hits >= ?", (self.min_hits,)
+            ).fetchone()
+            if signature != self._signature or self._automaton is None:
+                # 同一错误写法有多个改法时取确认次数最多的
+                words = {}
+                for wrong, right in conn.execute(
+                    "SELECT wrong, correct FROM known_errors WHERE hits >= ? ORDER BY hits",
+                    (self.min_hits,)
+                ):
+                    words[wrong] = right
+                self._automaton = _build_automaton(words) if words else False
+                self._signature = signature
+                logger.info(f"错别字词典已编译: {len(words)} 条")
+            self._checked = now
+            return self._automaton
+
+    def match(self, sentence):
+        """返回句子中命中的已知错误 [(起始位置, 错误写法, 正确写法)]，互不重叠"""
+        try:
+            automaton = self._refresh()
+        except Exception as e:
+            logger.error(f"读取错别字词典出错: {str(e)}")
+            return []
+        if not automaton:
+            return []
+
+        # 同一位置取最长的匹配，然后从左到右选择不重叠的匹配
+        candidates = sorted(
+            ((end - len(word) + 1, -len(word), word, right) for end, (word, right) in automaton.iter(sentence))
+        )
+        hits = []
+        position = 0
+        for start, _, word, right in candidates:
+            if start >= position:
+                hits.append((start, word, right))
+                position = start + len(word)
+        return hits
+
+    def check(self, sentence):
+        """命中已知错误时返回检查结果字典，否则返回None"""
+        hits = self.match(sentence)
+        if not hits:
+            return None
+        corrected = sentence
+        for start, word, right in reversed(hits):
+            corrected = corrected[:start] + right + corrected[start + len(word):]
+        return {
+            "wrong": True,
+            "annotation": "；".join(f'"{word}" 应改为 "{right}"' for _, word, right in hits),
+            "content_1": corrected,
+            "source": "dictionary"
+        }
+
+    def stats(self):
+        conn = self._conn()
+        total, active = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(hits >= ?), 0) FROM known_errors", (self.min_hits,)
+        ).fetchone()
+        return {'entries': total, 'active': active, 'min_hits': self.min_hits}
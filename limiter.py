@@ -0,0 +1,238 @@
+import time
+import uuid
+import random
+import logging
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+from db import get_connection
+
+logger = logging.getLogger(__name__)
+
+class AdaptiveLimiter:
+    """单个上游服务的自适应并发限制（AIMD）
+
+    - 请求成功且耗时正常时，并发上限缓慢增加（每个并发窗口+1）
+    - 遇到429或5xx时，并发上限减半；同一拥塞窗口内（上次减半之前发出的请求）
+      的多个失败只减半一次；有Retry-After时在此之前暂停所有请求
+    并发上限、暂停时间和在途请求（租约）都保存在SQLite中，所有gunicorn worker共享。
+    进程异常退出时遗留的租约在 lease_timeout 秒后自动失效。
+    等待名额时先用只读查询判断，有空闲名额时才获取写锁；本进程归还名额时立即
+    唤醒等待的线程，其他进程归还的名额通过逐渐拉长间隔的轮询发现。
+    """
+
+    def __init__(self, path, name, initial_limit=8, min_limit=1, max_limit=64,
+                 latency_slo=15.0, lease_timeout=300):
+        self.path = path
+        self.name = name
+        self.initial_limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_slo = latency_slo  # 超过该耗时（秒）的成功请求不再提高并发上限
+        self.lease_timeout = lease_timeout
+        self._released = threading.Condition()
+        self._init_db()
+
+    def _conn(self):
+        return get_connection(self.path)
+
+    def _init_db(self):
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS limiter_state (
+                name TEXT PRIMARY KEY,
+                concurrency REAL NOT NULL,
+                blocked_until REAL NOT NULL DEFAULT 0
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS limiter_leases (
+                id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                expires REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_limiter_leases_name ON limiter_leases (name)")
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(limiter_state)")]
+        if 'last_decrease' not in columns:
+            conn.execute("ALTER TABLE limiter_state ADD COLUMN last_decrease REAL NOT NULL DEFAULT 0")
+        conn.execute(
+            "INSERT OR IGNORE INTO limiter_state (name, concurrency) VALUES (?, ?)",
+            (self.name, float(self.initial_limit))
+        )
+
+    def acquire(self, timeout=300):
+        """等待可用的并发名额，返回租约ID；超时抛出TimeoutError"""
+        deadline = time.time() + timeout
+        conn = self._conn()
+        backoff = 0.05
+        while True:
+            now = time.time()
+            # 只读查询不需要写锁，名额已满时不必排队等待 BEGIN IMMEDIATE
+            concurrency, blocked_until = conn.execute(
+                "SELECT concurrency, blocked_until FROM limiter_state WHERE name = ?", (self.name,)
+            ).fetchone()
+            in_flight = conn.execute(
+                "SELECT COUNT(*) FROM limiter_leases WHERE name = ? AND expires >= ?", (self.name, now)
+            ).fetchone()[0]
+            if now < blocked_until or in_flight >= max(self.min_limit, int(concurrency)):
+                if now >= deadline:
+                    raise TimeoutError(f"等待上游并发名额超时: {self.name}")
+                # 暂停期内等到暂停结束，否则等待本进程归还名额或轮询间隔到期
+                wait = blocked_until - now if now < blocked_until else random.uniform(backoff / 2, backoff)
+                backoff = min(backoff * 2, 1.0)
+                with self._released:
+                    self._released.wait(min(wait, max(0.0, deadline - now)) or 0.05)
+                continue
+            
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM limiter_leases WHERE name = ? AND expires < ?", (self.name, now))
+                concurrency, blocked_until = conn.execute(
+                    "SELECT concurrency, blocked_until FROM limiter_state WHERE name = ?", (self.name,)
+                ).fetchone()
+                in_flight = conn.execute(
+                    "SELECT COUNT(*) FROM limiter_leases WHERE name = ?", (self.name,)
+                ).fetchone()[0]
+                
+                lease_id = None
+                if now >= blocked_until and in_flight < max(self.min_limit, int(concurrency)):
+                    lease_id = uuid.uuid4().hex
+                    conn.execute(
+                        "INSERT INTO limiter_leases (id, name, expires) VALUES (?, ?, ?)",
+                        (lease_id, self.name, now + self.lease_timeout)
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            
+            if lease_id:
+                return lease_id
+            if now >= deadline:
+                raise TimeoutError(f"等待上游并发名额超时: {self.name}")
+            # 其他进程抢先拿到了名额，短暂等待后重试
+            time.sleep(random.uniform(0.01, 0.05))
+
+    def release(self, lease_id, status_code=None, latency=None, retry_after=None):
+        """归还租约并根据结果调整并发上限
+
+        status_code 为None表示请求异常（如连接失败），按服务端错误处理
+        """
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM limiter_leases WHERE id = ?", (lease_id,))
+            concurrency, blocked_until, last_decrease = conn.execute(
+                "SELECT concurrency, blocked_until, last_decrease FROM limiter_state WHERE name = ?", (self.name,)
+            ).fetchone()
+            
+            if status_code is None or status_code == 429 or status_code >= 500:
+                if retry_after:
+                    blocked_until = max(blocked_until, now + retry_after)
+                # 乘性减少：上次减半之前发出的请求属于同一拥塞窗口，不再重复减半
+                if now - (latency or 0) >= last_decrease:
+                    concurrency = max(float(self.min_limit), concurrency / 2)
+                    last_decrease = now
+                    logger.warning(f"上游限流或出错({self.name}, 状态码={status_code})，并发上限降为{int(concurrency)}")
+            elif status_code < 400 and (latency is None or latency <= self.latency_slo):
+                # 加性增加：每完成一个并发窗口的成功请求，上限+1
+                concurrency = min(float(self.max_limit), concurrency + 1 / max(concurrency, 1.0))
+            
+            conn.execute(
+                "UPDATE limiter_state SET concurrency = ?, blocked_until = ?, last_decrease = ? WHERE name = ?",
+                (concurrency, blocked_until, last_decrease, self.name)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        with self._released:
+            self._released.notify_all()
+
+    def state(self):
+        """当前并发上限、在途请求数和暂停剩余时间"""
+        conn = self._conn()
+        now = time.time()
+        concurrency, blocked_until = conn.execute(
+            "SELECT concurrency, blocked_until FROM limiter_state WHERE name = ?", (self.name,)
+        ).fetchone()
+        in_flight = conn.execute(
+            "SELECT COUNT(*) FROM limiter_leases WHERE name = ? AND expires >= ?", (self.name, now)
+        ).fetchone()[0]
+        return {
+            'limit': int(concurrency),
+            'in_flight': in_flight,
+            'blocked_for': round(max(0.0, blocked_until - now), 3)
+        }
+
+class LimiterRegistry:
+    """按上游主机名分别创建限流器"""
+
+    def __init__(self, path, **options):
+        self.path = path
+        self.options = options
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def for_url(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            limiter = self._limiters.get(host)
+            if limiter is None:
+                limiter = self._limiters[host] = AdaptiveLimiter(self.path, host, **self.options)
+            return limiter
+
+    def states(self):
+        with self._lock:
+            limiters = dict(self._limiters)
+        return {host: limiter.state() for host, limiter in limiters.items()}
+
+def parse_retry_after(value):
+    """解析Retry-After头（秒数或HTTP日期），返回秒数"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def request_with_retry(limiter, send, max_retries=3, base_delay=1.0, max_delay=30.0):
+    """在限流器控制下发送请求，遇到429、5xx或网络异常时按指数退避（带随机抖动）重试
+
+    send() 发送一次请求并返回响应；重试用尽后返回最后一次响应或抛出最后一次异常
+    """
+    attempt = 0
+    while True:
+        lease_id = limiter.acquire()
+        start_time = time.time()
+        response = None
+        try:
+            response = send()
+        except Exception:
+            limiter.release(lease_id, None, time.time() - start_time)
+            if attempt >= max_retries:
+                raise
+            retry_after = None
+        else:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            limiter.release(lease_id, response.status_code, time.time() - start_time, retry_after)
+            if (response.status_code != 429 and response.status_code < 500) or attempt >= max_retries:
+                return response
+        
+        # 优先遵守Retry-After，否则使用“完全抖动”的指数退避
+        delay = retry_after if retry_after is not None else random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+        attempt += 1
+        status = response.status_code if response is not None else '请求异常'
+        logger.warning(f"上游请求失败({limiter.name}, {status})，{delay:.2f}秒后第{attempt}次重试")
+        time.sleep(delay)
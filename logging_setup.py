@@ -0,0 +1,216 @@
+import atexit
+import glob
+import json
+import os
+import queue
+import random
+import re
+import time
+import logging
+import logging.handlers
+from datetime import datetime
+
+# 控制台使用的文本格式
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+class JsonLinesFormatter(logging.Formatter):
+    """每条日志输出为一行JSON，extra={'fields': {...}} 中的字段合并到记录中"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'pid': record.process,
+            'thread': record.threadName,
+            'message': record.getMessage()
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class TextFormatter(logging.Formatter):
+    """文本格式，附带的字段以JSON追加在消息之后"""
+
+    def format(self, record):
+        text = super().format(record)
+        fields = getattr(record, 'fields', None)
+        if fields:
+            text += ' ' + json.dumps(fields, ensure_ascii=False, default=str)
+        return text
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """只把记录放入队列，格式化和写文件都在后台线程中进行"""
+
+    def prepare(self, record):
+        # 只合并消息参数、把异常转为文本，附加字段保留给后台线程的格式化器
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+_listener = None
+_file_options = None
+
+def setup_logging(log_file='app.log', level=logging.INFO, max_bytes=10 * 1024 * 1024, backup_count=5,
+                  json_lines=True, orphan_ttl=24 * 3600):
+    """配置非阻塞日志：调用线程只把记录放入队列，由后台线程写控制台和文件
+
+    文件按大小轮转，json_lines 为True时每条记录写为一行JSON。
+    多个进程各自轮转同一个文件会丢失记录（Windows上还会因文件被占用而无法改名），
+    所以只有第一个配置日志的进程写 log_file，其他进程（如gunicorn worker，不论是否
+    --preload）写各自的 <文件名>.<进程号>.log；已退出进程的日志文件超过 orphan_ttl
+    秒未修改后删除
+    """
+    global _listener, _file_options
+
+    _file_options = (log_file, max_bytes, backup_count, json_lines, orphan_ttl)
+    console = logging.StreamHandler()
+    console.setFormatter(TextFormatter(TEXT_FORMAT))
+    file_handler = _file_handler(_claim_log_file(log_file), max_bytes, backup_count, json_lines)
+    _prune_process_logs(log_file, orphan_ttl)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(level)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_QueueHandler(log_queue))
+
+    _listener = logging.handlers.QueueListener(log_queue, console, file_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_stop_listener)
+    # fork出的子进程（如gunicorn worker）没有父进程的后台线程，需要重新启动
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=_restart_listener)
+
+def _file_handler(log_file, max_bytes, backup_count, json_lines):
+    handler = logging.handlers.RotatingFileHandler(
+        log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+    )
+    handler.setFormatter(JsonLinesFormatter() if json_lines else TextFormatter(TEXT_FORMAT))
+    return handler
+
+def process_log_file(log_file, pid=None):
+    """子进程使用的日志文件名，如 app.log -> app.1234.log"""
+    base, ext = os.path.splitext(log_file)
+    return f"{base}.{pid or os.getpid()}{ext}"
+
+def _claim_log_file(log_file):
+    """返回本进程应写的日志文件
+
+    <文件名>.pid 记录写 log_file 的进程，该进程已退出时由本进程接替，否则使用本进程自己的文件
+    """
+    pid_file = log_file + '.pid'
+    for _ in range(2):
+        try:
+            fd = os.open(pid_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            owner = _read_pid(pid_file)
+            if owner == os.getpid():
+                return log_file
+            if owner is None or _pid_alive(owner):
+                # 读不到进程号时可能是其他进程刚创建、还没写入
+                return process_log_file(log_file)
+            try:
+                os.remove(pid_file)
+            except OSError:
+                pass
+            continue
+        with os.fdopen(fd, 'w') as f:
+            f.write(str(os.getpid()))
+        atexit.register(_release_log_file, pid_file)
+        return log_file
+    return process_log_file(log_file)
+
+def _release_log_file(pid_file):
+    # fork出的子进程也继承了这个退出回调，只删除本进程登记的文件
+    if _read_pid(pid_file) == os.getpid():
+        try:
+            os.remove(pid_file)
+        except OSError:
+            pass
+
+def _read_pid(path):
+    try:
+        with open(path, 'r') as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+def _pid_alive(pid):
+    """进程是否仍在运行"""
+    if os.name == 'nt':
+        # Windows上 os.kill 会结束目标进程，改为查询进程退出码
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        try:
+            code = ctypes.c_ulong()
+            kernel32.GetExitCodeProcess(handle, ctypes.byref(code))
+            return code.value == 259  # STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _prune_process_logs(log_file, orphan_ttl):
+    """删除已退出进程留下的 <文件名>.<进程号>.log 及其轮转文件"""
+    base, ext = os.path.splitext(log_file)
+    pattern = re.compile(re.escape(os.path.basename(base)) + r'\.(\d+)' + re.escape(ext) + r'(?:\.\d+)?$')
+    expire = time.time() - orphan_ttl
+    for path in glob.glob(f"{glob.escape(base)}.*{ext}*"):
+        match = pattern.match(os.path.basename(path))
+        if not match or int(match.group(1)) == os.getpid():
+            continue
+        try:
+            if os.path.getmtime(path) < expire and not _pid_alive(int(match.group(1))):
+                os.remove(path)
+        except OSError:
+            pass
+
+def _stop_listener():
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+def _restart_listener():
+    if _listener is not None:
+        # 队列中尚未写出的记录由父进程负责，子进程丢弃以免重复
+        while True:
+            try:
+                _listener.queue.get_nowait()
+            except queue.Empty:
+                break
+        # 换成本进程自己的日志文件，继承来的文件句柄只在子进程中关闭
+        log_file, max_bytes, backup_count, json_lines, _ = _file_options
+        handlers = []
+        for handler in _listener.handlers:
+            if isinstance(handler, logging.handlers.RotatingFileHandler):
+                handler.close()
+                handler = _file_handler(process_log_file(log_file), max_bytes, backup_count, json_lines)
+            handlers.append(handler)
+        _listener.handlers = tuple(handlers)
+        _listener._thread = None
+        _listener.start()
+
+def sample_body(text, sample_rate, max_chars, force=False):
+    """按采样率决定是否记录请求/响应内容，超过 max_chars 时截断；不记录时返回None"""
+    if not force and (sample_rate <= 0 or random.random() >= sample_rate):
+        return None
+    if max_chars and len(text) > max_chars:
+        return f"{text[:max_chars]}...(共{len(text)}字符)"
+    return text
@@ -0,0 +1,276 @@
+import atexit
+import json
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+from db import get_connection
+
+logger = logging.getLogger(__name__)
+
+# 耗时直方图的默认分桶（秒）
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+class Metrics:
+    """Prometheus格式的运行指标，多个worker进程汇总
+
+    每个进程在内存中累计自己的计数器、直方图和当前值，后台线程定期按进程号写入
+    SQLite；抓取时把所有进程的数据相加。当前值（如在途请求数）超过 stale_after 秒
+    未更新的视为已失效；进程超过 fold_after 秒没有写入时视为已退出，它的计数器和
+    直方图并入进程号为0的汇总行后删除，表中的行数不随worker重启而增长
+    """
+
+    def __init__(self, path, prefix='', flush_interval=5, stale_after=60, fold_after=600):
+        self.path = path
+        self.prefix = prefix
+        self.flush_interval = flush_interval
+        self.stale_after = stale_after
+        self.fold_after = fold_after
+        self._definitions = {}  # 名称 -> (类型, 说明, 分桶)
+        self._values = {}  # (名称, 标签) -> 数值，直方图为 [各分桶计数..., 总和, 次数]
+        self._collectors = []
+        self._lock = threading.Lock()
+        self._pid = None
+        self._init_db()
+
+    def _conn(self):
+        return get_connection(self.path)
+
+    def _init_db(self):
+        self._conn().execute("""
+            CREATE TABLE IF NOT EXISTS metrics (
+                pid INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                labels TEXT NOT NULL,
+                value TEXT NOT NULL,
+                updated REAL NOT NULL,
+                PRIMARY KEY (pid, name, labels)
+            )
+        """)
+
+    # 定义指标
+
+    def counter(self, name, help_text):
+        self._definitions[self.prefix + name] = ('counter', help_text, None)
+
+    def gauge(self, name, help_text):
+        self._definitions[self.prefix + name] = ('gauge', help_text, None)
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self._definitions[self.prefix + name] = ('histogram', help_text, tuple(buckets))
+
+    def add_collector(self, collector):
+        """collector() 返回 [(名称, 标签字典, 数值)]，在每次写入前调用，用于队列长度等当前值"""
+        self._collectors.append(collector)
+
+    # 记录数据
+
+    def inc(self, name, value=1, **labels):
+        """计数器加value，或当前值加减value"""
+        key = (self.prefix + name, _label_key(labels))
+        self._ensure_started()
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        key = (self.prefix + name, _label_key(labels))
+        with self._lock:
+            self._values[key] = value
+
+    def observe(self, name, value, **labels):
+        """直方图记录一次观测值"""
+        name = self.prefix + name
+        buckets = self._definitions[name][2]
+        key = (name, _label_key(labels))
+        self._ensure_started()
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * (len(buckets) + 2)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def track(self, histogram, in_flight=None, **labels):
+        """记录代码块耗时，in_flight 为在途数量指标名"""
+        if in_flight:
+            self.inc(in_flight, 1, **labels)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(histogram, time.perf_counter() - start, **labels)
+            if in_flight:
+                self.inc(in_flight, -1, **labels)
+
+    # 写入和汇总
+
+    def _ensure_started(self):
+        # fork出的子进程需要重新启动写入线程
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            self._pid = pid
+            self._values = {}
+            threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+            atexit.register(self._flush_at_exit)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f"写入运行指标失败: {str(e)}")
+
+    def _flush_at_exit(self):
+        # 进程正常退出时写入最后一次，不丢失最后一个周期的数据
+        if self._pid == os.getpid():
+            try:
+                self.flush()
+            except Exception:
+                pass
+
+    def flush(self):
+        """把本进程的指标写入SQLite"""
+        self._ensure_started()
+        for collector in self._collectors:
+            try:
+                for name, labels, value in collector():
+                    self.set(name, value, **labels)
+            except Exception as e:
+                logger.warning(f"采集运行指标失败: {str(e)}")
+        with self._lock:
+            values = list(self._values.items())
+        if not values:
+            return
+        pid = os.getpid()
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO metrics (pid, name, labels, value, updated) VALUES (?, ?, ?, ?, ?)",
+                [(pid, name, labels, json.dumps(value), now) for (name, labels), value in values]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _fold_exited(self):
+        """把已退出进程的计数器和直方图累加到进程号为0的汇总行，删除这些进程的所有行"""
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            pids = [pid for (pid,) in conn.execute(
+                "SELECT pid FROM metrics WHERE pid != 0 GROUP BY pid HAVING MAX(updated) < ?",
+                (now - self.fold_after,)
+            )]
+            if not pids:
+                conn.execute("COMMIT")
+                return
+            placeholders = ','.join('?' * len(pids))
+            totals = {
+                (name, labels): json.loads(value) for name, labels, value in conn.execute(
+                    "SELECT name, labels, value FROM metrics WHERE pid = 0"
+                )
+            }
+            for name, labels, value in conn.execute(
+                f"SELECT name, labels, value FROM metrics WHERE pid IN ({placeholders})", pids
+            ).fetchall():
+                definition = self._definitions.get(name)
+                # 已退出进程的当前值没有意义，直接丢弃
+                if definition is None or definition[0] == 'gauge':
+                    continue
+                value = json.loads(value)
+                current = totals.get((name, labels))
+                if current is None:
+                    totals[(name, labels)] = value
+                elif isinstance(value, list):
+                    totals[(name, labels)] = [a + b for a, b in zip(current, value)]
+                else:
+                    totals[(name, labels)] = current + value
+            conn.execute(f"DELETE FROM metrics WHERE pid IN ({placeholders})", pids)
+            conn.executemany(
+                "INSERT OR REPLACE INTO metrics (pid, name, labels, value, updated) VALUES (0, ?, ?, ?, ?)",
+                [(name, labels, json.dumps(value), now) for (name, labels), value in totals.items()]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def render(self, extra=()):
+        """汇总所有进程的指标，输出Prometheus文本格式
+
+        extra 为 [(名称, 类型, 说明, [(标签字典, 数值)])]，用于抓取时直接读取的指标
+        """
+        self.flush()
+        self._fold_exited()
+        stale = time.time() - self.stale_after
+        totals = {}
+        for name, labels, value, updated in self._conn().execute(
+            "SELECT name, labels, value, updated FROM metrics"
+        ):
+            definition = self._definitions.get(name)
+            if definition is None or (definition[0] == 'gauge' and updated < stale):
+                continue
+            value = json.loads(value)
+            current = totals.get((name, labels))
+            if current is None:
+                totals[(name, labels)] = value
+            elif isinstance(value, list):
+                totals[(name, labels)] = [a + b for a, b in zip(current, value)]
+            else:
+                totals[(name, labels)] = current + value
+
+        lines = []
+        for name, (kind, help_text, buckets) in self._definitions.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for (series_name, labels), value in sorted(totals.items()):
+                if series_name != name:
+                    continue
+                labels = json.loads(labels)
+                if kind == 'histogram':
+                    for bound, count in zip(buckets, value):
+                        lines.append(f"{name}_bucket{_format_labels(labels + [['le', _format_number(bound)]])} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(labels + [['le', '+Inf']])} {value[-1]}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {_format_number(value[-2])}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {value[-1]}")
+                else:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_number(value)}")
+
+        for name, kind, help_text, samples in extra:
+            name = self.prefix + name
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(sorted(labels.items()))} {_format_number(value)}")
+        return '\n'.join(lines) + '\n'
+
+def _label_key(labels):
+    return json.dumps(sorted([key, str(value)] for key, value in labels.items()), ensure_ascii=False)
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
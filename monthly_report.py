@@ -0,0 +1,165 @@
+import os
+import time
+import logging
+import threading
+import tempfile
+from datetime import datetime
+
+from openpyxl import Workbook
+
+from db import get_connection
+from result_store import COLUMNS
+
+logger = logging.getLogger(__name__)
+
+class MonthlyReport:
+    """月度巡检报表
+
+    结果行在产生时追加到结果存储，按文件和错别字的汇总在写入时同步更新。
+    报表文件按月缓存在磁盘上，只有当月数据版本变化后才重新生成；新结果写入后
+    在后台延迟刷新，下载时直接返回已生成好的文件，数据有更新时另外触发后台刷新。
+    生成前先在数据库中登记，多个worker进程同一时间只有一个在生成同一个月的报表。
+    """
+
+    def __init__(self, store, folder, refresh_delay=30, build_timeout=600):
+        self.store = store
+        self.folder = folder
+        self.refresh_delay = refresh_delay  # 写入结果后延迟多少秒刷新报表，合并短时间内的多次写入
+        self.build_timeout = build_timeout  # 生成报表的登记超过该秒数视为生成进程已退出
+        self._timers = {}
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+        get_connection(self.store.path).execute("""
+            CREATE TABLE IF NOT EXISTS report_builds (
+                month TEXT PRIMARY KEY,
+                claimed_until REAL NOT NULL
+            )
+        """)
+
+    def path_for(self, month):
+        year, month_number = month.split('-')
+        return os.path.join(self.folder, f"自动文字巡检结果{year}年{int(month_number)}月.xlsx")
+
+    def _version_path(self, month):
+        return self.path_for(month) + '.version'
+
+    def _built_version(self, month):
+        try:
+            with open(self._version_path(month), 'r', encoding='utf-8') as f:
+                return int(f.read().strip())
+        except (FileNotFoundError, ValueError):
+            return -1
+
+    def ensure(self, month):
+        """返回当月报表路径
+
+        已有报表时直接返回，数据有更新则在后台刷新；还没有生成过时当场生成
+        """
+        path = self.path_for(month)
+        if os.path.exists(path):
+            if self.store.monthly_version(month) != self._built_version(month):
+                self.schedule_refresh(month, delay=0)
+            return path
+        self._build_claimed(month, wait=True)
+        return path
+
+    def schedule_refresh(self, month, delay=None):
+        """新结果写入后在后台延迟刷新报表"""
+        with self._lock:
+            if month in self._timers:
+                return
+            timer = threading.Timer(self.refresh_delay if delay is None else delay, self._refresh, args=(month,))
+            timer.daemon = True
+            self._timers[month] = timer
+            timer.start()
+
+    def _refresh(self, month):
+        with self._lock:
+            self._timers.pop(month, None)
+        try:
+            if not self._build_claimed(month):
+                # 其他进程正在生成，它读到的数据可能不含最新的写入，稍后再检查一次
+                self.schedule_refresh(month)
+        except Exception as e:
+            logger.error(f"刷新月度报表失败({month}): {str(e)}")
+
+    def _claim(self, month):
+        now = time.time()
+        cursor = get_connection(self.store.path).execute("""
+            INSERT INTO report_builds (month, claimed_until) VALUES (?, ?)
+            ON CONFLICT (month) DO UPDATE SET claimed_until = excluded.claimed_until WHERE claimed_until < ?
+        """, (month, now + self.build_timeout, now))
+        return cursor.rowcount > 0
+
+    def _release_claim(self, month):
+        get_connection(self.store.path).execute(
+            "UPDATE report_builds SET claimed_until = 0 WHERE month = ?", (month,)
+        )
+
+    def _build_claimed(self, month, wait=False):
+        """没有其他进程在生成时生成报表，已是最新版本则跳过；返回是否由本进程处理
+
+        wait 为True时等待其他进程生成完毕
+        """
+        path = self.path_for(month)
+        deadline = time.time() + self.build_timeout
+        while not self._claim(month):
+            if not wait:
+                return False
+            if time.time() > deadline:
+                raise TimeoutError(f"等待生成月度报表超时: {month}")
+            time.sleep(0.5)
+            if os.path.exists(path):
+                return True
+        try:
+            version = self.store.monthly_version(month)
+            if version != self._built_version(month) or not os.path.exists(path):
+                self._build(month, version)
+        finally:
+            self._release_claim(month)
+        return True
+
+    def _build(self, month, version):
+        start_time = time.time()
+        month_start = datetime.strptime(month, '%Y-%m')
+        if month_start.month == 12:
+            month_end = month_start.replace(year=month_start.year + 1, month=1)
+        else:
+            month_end = month_start.replace(month=month_start.month + 1)
+        
+        # 只写模式逐行写入，内存占用不随行数增长
+        workbook = Workbook(write_only=True)
+        
+        detail = workbook.create_sheet('巡检结果')
+        headers = [header for _, header in COLUMNS]
+        detail.append(headers)
+        for row in self.store.iter_rows(start=month_start.timestamp(), end=month_end.timestamp()):
+            detail.append([row[header] for header in headers])
+        
+        file_sheet = workbook.create_sheet('按文件统计')
+        file_sheet.append(['文件名称', '句子数', '错别字句数'])
+        for filename, sentences, wrong in self.store.monthly_file_stats(month):
+            file_sheet.append([filename, sentences, wrong])
+        
+        typo_sheet = workbook.create_sheet('常见错别字')
+        typo_sheet.append(['错别字', '正确写法', '次数'])
+        for typo, count in self.store.monthly_top_typos(month):
+            wrong, _, right = typo.partition('→')
+            typo_sheet.append([wrong, right, count])
+        
+        # 先写临时文件再替换，下载中的旧文件不受影响
+        path = self.path_for(month)
+        fd, tmp_path = tempfile.mkstemp(dir=self.folder, suffix='.xlsx.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                workbook.save(f)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+        # 版本号同样原子替换；先替换报表再写版本号，中途失败最多导致多生成一次
+        fd, tmp_path = tempfile.mkstemp(dir=self.folder, suffix='.version.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(str(version))
+        os.replace(tmp_path, self._version_path(month))
+        logger.info(f"月度报表已生成: {path}, 版本{version}, 耗时{time.time() - start_time:.3f}秒")
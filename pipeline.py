@@ -0,0 +1,84 @@
+import queue
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+class StagedPipeline:
+    """OCR → 文字检查 两级流水线
+
+    两个阶段各有独立的线程池。待处理任务进入OCR阶段的输入队列（不限长度，
+    任务本身已持久化在任务存储中）；OCR结果通过有界队列交给检查阶段，检查阶段
+    跟不上时OCR线程会阻塞等待，不会提前识别过多图片。这样第N+1张图片的OCR
+    可以与第N张图片的检查同时进行。
+    """
+
+    def __init__(self, ocr_stage, check_stage, ocr_workers=2, check_workers=2, queue_size=4):
+        # ocr_stage(task) 返回OCR结果，返回None表示任务已结束（如失败），不再进入检查阶段
+        # check_stage(task, ocr_output) 完成检查并保存结果
+        self.ocr_stage = ocr_stage
+        self.check_stage = check_stage
+        self.ocr_workers = max(1, int(ocr_workers))
+        self.check_workers = max(1, int(check_workers))
+        self._ocr_queue = queue.Queue()
+        self._check_queue = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._lock = threading.Lock()
+        self._started = False
+        self._active = {'ocr': 0, 'check': 0}
+
+    def _start(self):
+        # 线程在第一次提交任务时才启动，避免在gunicorn fork之前创建
+        with self._lock:
+            if self._started:
+                return
+            for i in range(self.ocr_workers):
+                threading.Thread(target=self._ocr_loop, name=f'pipeline-ocr-{i}', daemon=True).start()
+            for i in range(self.check_workers):
+                threading.Thread(target=self._check_loop, name=f'pipeline-check-{i}', daemon=True).start()
+            self._started = True
+
+    def submit(self, task):
+        """提交任务，立即返回"""
+        self._start()
+        self._ocr_queue.put(task)
+
+    def _ocr_loop(self):
+        while True:
+            task = self._ocr_queue.get()
+            self._set_active('ocr', 1)
+            try:
+                ocr_output = self.ocr_stage(task)
+            except Exception as e:
+                logger.error(f"OCR阶段出错: {str(e)}")
+                ocr_output = None
+            finally:
+                self._set_active('ocr', -1)
+            
+            if ocr_output is not None:
+                # 检查阶段的队列已满时在此阻塞（背压）
+                self._check_queue.put((task, ocr_output))
+
+    def _check_loop(self):
+        while True:
+            task, ocr_output = self._check_queue.get()
+            self._set_active('check', 1)
+            try:
+                self.check_stage(task, ocr_output)
+            except Exception as e:
+                logger.error(f"检查阶段出错: {str(e)}")
+            finally:
+                self._set_active('check', -1)
+
+    def _set_active(self, stage, delta):
+        with self._lock:
+            self._active[stage] += delta
+
+    def stats(self):
+        """各阶段的排队数和正在处理的任务数"""
+        with self._lock:
+            return {
+                'ocr_queue': self._ocr_queue.qsize(),
+                'ocr_active': self._active['ocr'],
+                'check_queue': self._check_queue.qsize(),
+                'check_active': self._active['check']
+            }
@@ -0,0 +1,104 @@
+import json
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# 回复为文本时表示没有错别字的关键词
+NO_ERROR_KEYWORDS = ("没有错别字", "无错别字", "无错误", "无拼写错误", "无需修改", "无误", "准确", "正确")
+
+# 预先编译的正则表达式，每个句子的回复只扫描需要的部分
+_NO_ERROR_RE = re.compile('|'.join(map(re.escape, NO_ERROR_KEYWORDS)))
+_ERROR_RE = re.compile(r'错别字[:：](.*?)(?:建议[:：]|$)', re.DOTALL)
+_TYPO_RE = re.compile(r'[""「](.+?)[""」]\s*应(?:该)?[为是]\s*[""「](.+?)[""」]')
+_SUGGESTION_RE = re.compile(r'建议[:：](.*?)$', re.DOTALL)
+_ALT_TYPO_RE = re.compile(r'[""「](.+?)[""」].*?错别字.*?应(?:该)?[为是]\s*[""「](.+?)[""」]', re.DOTALL)
+
+def strip_code_fence(content):
+    """去除回复内容中可能的 ```json 或 ``` 代码块标记"""
+    content = content.strip()
+    if content.startswith("```json"):
+        content = content[7:]  # 去除开头的 ```json
+    elif content.startswith("```"):
+        content = content[3:]  # 去除开头的 ```
+
+    if content.endswith("```"):
+        content = content[:-3]  # 去除结尾的 ```
+
+    return content.strip()
+
+def build_check_result(json_content):
+    """根据模型输出的wrong字段构建检查结果"""
+    is_wrong = json_content.get("wrong", False)
+    return {
+        "wrong": is_wrong,  # 添加wrong字段到结果中
+        "annotation": json_content.get("annotation", "") if is_wrong else "无",
+        "content_1": json_content.get("content_1", "") if is_wrong else "无"
+    }
+
+def parse_check_reply(content):
+    """解析单句检查的助手回复（已去除代码块标记），返回检查结果的JSON字符串
+
+    依次尝试：整体按JSON解析；截取第一个 { 到最后一个 } 之间的内容按JSON解析；
+    按文本提取错别字。整体解析出的不是JSON对象时抛出AttributeError，由调用方处理
+    """
+    try:
+        json_content = json.loads(content)
+    except json.JSONDecodeError as e:
+        logger.warning(f"JSON解析错误: {str(e)}")
+    else:
+        return json.dumps(build_check_result(json_content), ensure_ascii=False)
+
+    # 等价于 re.search(r'\{.*\}', content, re.DOTALL)，但不需要回溯
+    start = content.find('{')
+    end = content.rfind('}')
+    if start != -1 and end > start:
+        try:
+            result = build_check_result(json.loads(content[start:end + 1]))
+            logger.info("使用备选方式解析出JSON")
+            return json.dumps(result, ensure_ascii=False)
+        except Exception as e:
+            logger.warning(f"备选JSON解析也失败: {str(e)}")
+
+    return parse_text_reply(content)
+
+def parse_text_reply(content):
+    """处理文本格式的回复"""
+    logger.warning(f"返回内容不是有效的JSON格式: {content}")
+
+    # 检查是否包含"没有错别字"等关键词（关键词都是汉字，不需要先转小写）
+    if _NO_ERROR_RE.search(content):
+        return json.dumps({"annotation": "无", "content_1": "无"}, ensure_ascii=False)
+
+    # 尝试从文本中提取错别字信息
+    error_match = _ERROR_RE.search(content)
+
+    # 如果上面的方式没找到，尝试查找"X应为Y"或"X应该是Y"格式
+    if not error_match:
+        typo_match = _TYPO_RE.search(content)
+        if typo_match:
+            old_word, correct_word = typo_match.group(1), typo_match.group(2)
+            error = f'"{old_word}" 应改为 "{correct_word}"'
+            logger.info(f"使用'应为'模式提取到错别字: {error}")
+            return json.dumps({"annotation": error, "content_1": content}, ensure_ascii=False)
+
+    suggestion_match = _SUGGESTION_RE.search(content)
+
+    error = error_match.group(1).strip() if error_match else "无"
+    suggestion = suggestion_match.group(1).strip() if suggestion_match else "无"
+
+    # 如果错误信息为"无"，但内容中有明显的错别字提示，尝试查找格式为"X是错别字，应为Y"的模式
+    if error == "无" and ("错别字" in content or "应为" in content or "应改为" in content):
+        alt_match = _ALT_TYPO_RE.search(content)
+        if alt_match:
+            old_word, correct_word = alt_match.group(1), alt_match.group(2)
+            error = f'"{old_word}" 应改为 "{correct_word}"'
+            logger.info(f"使用备用模式提取到错别字: {error}")
+
+    # 如果无法提取到具体的错别字或建议，则使用全文作为建议
+    if error == "无" and suggestion == "无":
+        result = {"annotation": "无", "content_1": content}
+    else:
+        result = {"annotation": error, "content_1": suggestion}
+
+    return json.dumps(result, ensure_ascii=False)
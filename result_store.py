@@ -0,0 +1,211 @@
+import time
+import logging
+
+from db import get_connection
+from known_errors import extract_pairs
+
+logger = logging.getLogger(__name__)
+
+# 数据库列与导出表头的对应关系
+COLUMNS = [
+    ('filename', '文件名称'),
+    ('sentence_no', '句子编号'),
+    ('original', '原文'),
+    ('typo', '错别字'),
+    ('suggestion', '建议')
+]
+
+class ResultStore:
+    """逐句检查结果存储，基于SQLite，所有worker进程共享
+
+    结果按浏览器会话和批次归属，读取时分块迭代，内存占用不随结果数增长
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._init_db()
+
+    def _conn(self):
+        return get_connection(self.path)
+
+    def _init_db(self):
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT,
+                batch_id TEXT,
+                created REAL NOT NULL,
+                filename TEXT NOT NULL,
+                sentence_no INTEGER NOT NULL,
+                original TEXT NOT NULL,
+                typo TEXT NOT NULL,
+                suggestion TEXT NOT NULL,
+                wrong INTEGER NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_results_session ON results (session_id, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_results_batch ON results (batch_id, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_results_created ON results (created)")
+        
+        # 按月预先汇总的统计表，写入结果时同步更新
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS monthly_versions (
+                month TEXT PRIMARY KEY,
+                version INTEGER NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS monthly_file_stats (
+                month TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                sentences INTEGER NOT NULL,
+                wrong INTEGER NOT NULL,
+                PRIMARY KEY (month, filename)
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS monthly_typos (
+                month TEXT NOT NULL,
+                typo TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (month, typo)
+            )
+        """)
+
+    def add_rows(self, rows, session_id=None, batch_id=None):
+        """保存一张图片的结果行（与 /process 返回的 sentences 结构相同），并更新当月汇总
+        
+        返回结果所属的月份（YYYY-MM）
+        """
+        if not rows:
+            return None
+        now = time.time()
+        month = time.strftime('%Y-%m', time.localtime(now))
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                """INSERT INTO results
+                   (session_id, batch_id, created, filename, sentence_no, original, typo, suggestion, wrong)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                [
+                    (session_id, batch_id, now, row['文件名称'], int(row['句子编号']), row['原文'],
+                     row['错别字'], row['建议'], 1 if row['错别字'] else 0)
+                    for row in rows
+                ]
+            )
+            self._update_monthly_stats(conn, month, rows)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return month
+
+    def _update_monthly_stats(self, conn, month, rows):
+        file_stats = {}
+        typo_counts = {}
+        for row in rows:
+            stats = file_stats.setdefault(row['文件名称'], [0, 0])
+            stats[0] += 1
+            if row['错别字']:
+                stats[1] += 1
+                # 批注是自由文本，同一处错误的写法各不相同，按提取出的“错误→正确”词对计数
+                for wrong, right in extract_pairs(row['错别字'], row['原文'], row['建议']):
+                    typo = f"{wrong}→{right}"
+                    typo_counts[typo] = typo_counts.get(typo, 0) + 1
+        
+        conn.executemany(
+            """INSERT INTO monthly_file_stats (month, filename, sentences, wrong) VALUES (?, ?, ?, ?)
+               ON CONFLICT (month, filename) DO UPDATE SET
+               sentences = sentences + excluded.sentences, wrong = wrong + excluded.wrong""",
+            [(month, filename, sentences, wrong) for filename, (sentences, wrong) in file_stats.items()]
+        )
+        conn.executemany(
+            """INSERT INTO monthly_typos (month, typo, count) VALUES (?, ?, ?)
+               ON CONFLICT (month, typo) DO UPDATE SET count = count + excluded.count""",
+            [(month, typo, count) for typo, count in typo_counts.items()]
+        )
+        conn.execute(
+            """INSERT INTO monthly_versions (month, version) VALUES (?, 1)
+               ON CONFLICT (month) DO UPDATE SET version = version + 1""",
+            (month,)
+        )
+
+    def monthly_version(self, month):
+        """月度数据版本号，每次写入结果时递增"""
+        row = self._conn().execute(
+            "SELECT version FROM monthly_versions WHERE month = ?", (month,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def monthly_file_stats(self, month):
+        """当月按文件汇总的句子数和错别字句数"""
+        return self._conn().execute(
+            "SELECT filename, sentences, wrong FROM monthly_file_stats WHERE month = ? ORDER BY wrong DESC, filename",
+            (month,)
+        ).fetchall()
+
+    def monthly_top_typos(self, month, limit=100):
+        """当月出现次数最多的错别字，格式为“错误写法→正确写法”"""
+        return self._conn().execute(
+            "SELECT typo, count FROM monthly_typos WHERE month = ? ORDER BY count DESC, typo LIMIT ?",
+            (month, limit)
+        ).fetchall()
+
+    def _where(self, session_id=None, batch_id=None, only_wrong=False, start=None, end=None):
+        conditions = []
+        params = []
+        if session_id is not None:
+            conditions.append("session_id = ?")
+            params.append(session_id)
+        if batch_id is not None:
+            conditions.append("batch_id = ?")
+            params.append(batch_id)
+        if only_wrong:
+            conditions.append("wrong = 1")
+        if start is not None:
+            conditions.append("created >= ?")
+            params.append(start)
+        if end is not None:
+            conditions.append("created < ?")
+            params.append(end)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return where, params
+
+    def iter_rows(self, session_id=None, batch_id=None, only_wrong=False, start=None, end=None, chunk_size=1000):
+        """按保存顺序分块迭代结果行
+
+        only_wrong 只返回有错别字的行；start/end 为保存时间范围（时间戳，左闭右开）
+        """
+        where, params = self._where(session_id, batch_id, only_wrong, start, end)
+        select = ', '.join(column for column, _ in COLUMNS)
+        last_id = 0
+        conn = self._conn()
+        while True:
+            id_condition = f"{where} AND id > ?" if where else "WHERE id > ?"
+            rows = conn.execute(
+                f"SELECT id, {select} FROM results {id_condition} ORDER BY id LIMIT ?",
+                params + [last_id, chunk_size]
+            ).fetchall()
+            if not rows:
+                break
+            for row in rows:
+                yield {header: (str(value) if column == 'sentence_no' else value)
+                       for (column, header), value in zip(COLUMNS, row[1:])}
+            last_id = rows[-1][0]
+
+    def count(self, session_id=None, batch_id=None, only_wrong=False, start=None, end=None):
+        where, params = self._where(session_id, batch_id, only_wrong, start, end)
+        return self._conn().execute(f"SELECT COUNT(*) FROM results {where}", params).fetchone()[0]
+
+    def clear(self, session_id=None, batch_id=None):
+        """清空指定会话或批次的结果列表
+        
+        结果行仍保留在月度报表中，只是不再归属该会话或批次
+        """
+        if session_id is None and batch_id is None:
+            return
+        where, params = self._where(session_id, batch_id)
+        column = 'session_id' if session_id is not None else 'batch_id'
+        self._conn().execute(f"UPDATE results SET {column} = NULL {where}", params)
@@ -0,0 +1,56 @@
+import re
+from typing import NamedTuple
+
+# 句末标点：连续的句号、问号、感叹号、省略号视为一个句末（如“？！”、“……”）；
+# 英文句点后紧跟字母或数字时（如小数 3.14、网址）不作为句末，连续的多个句点（...）始终视为句末。
+# 句末标点后紧跟的右引号、右括号归入当前句子。
+_SENTENCE_END_RE = re.compile(r'(?:[。！？!?…]|\.{2,}|\.(?![0-9A-Za-z]))+[”’」』）)】》]*')
+
+class Span(NamedTuple):
+    """句子及其在原文中的位置，text == 原文[start:end]"""
+    start: int
+    end: int
+    text: str
+
+def split_sentences(text):
+    """把OCR文本切分为句子，返回Span列表
+
+    句子首尾空白不计入句子，空句子被丢弃
+    """
+    spans = []
+    start = 0
+    for match in _SENTENCE_END_RE.finditer(text):
+        _append_span(spans, text, start, match.end())
+        start = match.end()
+    _append_span(spans, text, start, len(text))  # 最后一句可能没有句末标点
+    return spans
+
+def _append_span(spans, text, start, end):
+    segment = text[start:end]
+    stripped = segment.strip()
+    if stripped:
+        start += len(segment) - len(segment.lstrip())
+        spans.append(Span(start, start + len(stripped), stripped))
+
+def pack_chunks(sentences, max_chars, max_items=None):
+    """按总字数和句子数上限把连续的句子打包，返回 (起始下标, 句子列表) 列表
+
+    单句超过 max_chars 时单独成块
+    """
+    chunks = []
+    current = []
+    current_chars = 0
+    start = 0
+    for i, sentence in enumerate(sentences):
+        length = len(sentence)
+        if current and (current_chars + length > max_chars or (max_items and len(current) >= max_items)):
+            chunks.append((start, current))
+            current = []
+            current_chars = 0
+        if not current:
+            start = i
+        current.append(sentence)
+        current_chars += length
+    if current:
+        chunks.append((start, current))
+    return chunks
@@ -0,0 +1,224 @@
+import contextvars
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import uuid
+import logging
+import tracemalloc
+from contextlib import contextmanager
+
+from db import get_connection
+
+logger = logging.getLogger(__name__)
+
+# 只统计本项目代码的CPU和内存开销
+_CODE_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+# cProfile和tracemalloc都是进程级的，同一时间只允许一个请求使用
+_profile_lock = threading.Lock()
+
+class Span:
+    """一段计时区间，子区间组成一棵树"""
+
+    __slots__ = ('name', 'attrs', 'start', 'end', 'children', 'thread')
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.start = time.perf_counter()
+        self.end = None
+        self.children = []
+        self.thread = threading.current_thread().name
+
+    @property
+    def duration(self):
+        return (self.end or time.perf_counter()) - self.start
+
+    def to_dict(self, origin=None):
+        origin = self.start if origin is None else origin
+        data = {
+            'name': self.name,
+            'start_ms': round((self.start - origin) * 1000, 2),
+            'duration_ms': round(self.duration * 1000, 2),
+            'thread': self.thread
+        }
+        if self.attrs:
+            data['attrs'] = self.attrs
+        if self.children:
+            data['children'] = [child.to_dict(origin) for child in self.children]
+        return data
+
+@contextmanager
+def span(name, **attrs):
+    """在当前请求的追踪中记录一段区间；不在追踪中时什么也不做"""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(name, attrs)
+    parent.children.append(child)
+    token = _current_span.set(child)
+    try:
+        yield child
+    finally:
+        child.end = time.perf_counter()
+        _current_span.reset(token)
+
+def propagate(fn):
+    """把当前追踪上下文带到线程池中执行的函数里，用法：executor.submit(propagate(fn), ...)"""
+    if _current_span.get() is None:
+        return fn
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+class Trace:
+    """一次请求的追踪，结束后 to_dict() 返回区间树和可选的性能分析结果
+
+    profile 为 'cpu' 时用cProfile统计本项目代码（只统计请求线程，线程池中的
+    检查请求不计入），为 'memory' 时用tracemalloc统计本项目代码的内存分配
+    """
+
+    def __init__(self, name, profile=None, **attrs):
+        self.id = uuid.uuid4().hex
+        self.root = Span(name, attrs)
+        self.profile = profile
+        self.created = time.time()
+        self.profile_result = None
+        self._token = None
+        self._profiler = None
+        self._started_tracemalloc = False
+        self._locked = False
+
+    def __enter__(self):
+        self._token = _current_span.set(self.root)
+        if self.profile in ('cpu', 'memory'):
+            self._locked = _profile_lock.acquire(blocking=False)
+            if not self._locked:
+                self.profile_result = {'error': '其他请求正在进行性能分析'}
+            elif self.profile == 'cpu':
+                self._profiler = cProfile.Profile()
+                self._profiler.enable()
+            elif not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracemalloc = True
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if self._profiler is not None:
+                self._profiler.disable()
+                self.profile_result = {'cpu': _format_cpu_profile(self._profiler)}
+            elif self._locked and self.profile == 'memory':
+                self.profile_result = {'memory': _format_memory_snapshot()}
+                if self._started_tracemalloc:
+                    tracemalloc.stop()
+        except Exception as e:
+            logger.warning(f"性能分析失败: {str(e)}")
+        finally:
+            if self._locked:
+                _profile_lock.release()
+            self.root.end = time.perf_counter()
+            _current_span.reset(self._token)
+
+    @property
+    def duration(self):
+        return self.root.duration
+
+    def to_dict(self):
+        data = {
+            'id': self.id,
+            'created': self.created,
+            'duration_ms': round(self.duration * 1000, 2),
+            'spans': self.root.to_dict()
+        }
+        if self.profile_result:
+            data['profile'] = self.profile_result
+        return data
+
+def _format_cpu_profile(profiler, limit=40):
+    """按累计耗时输出本项目代码中耗时最多的函数"""
+    output = io.StringIO()
+    stats = pstats.Stats(profiler, stream=output)
+    stats.sort_stats('cumulative').print_stats(_CODE_ROOT.replace('\\', '\\\\'), limit)
+    return output.getvalue()
+
+def _format_memory_snapshot(limit=30):
+    """本项目代码中分配内存最多的代码行，以及追踪期间的峰值"""
+    snapshot = tracemalloc.take_snapshot().filter_traces(
+        [tracemalloc.Filter(True, os.path.join(_CODE_ROOT, '*'))]
+    )
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        'current_bytes': current,
+        'peak_bytes': peak,
+        'top': [
+            {'location': str(stat.traceback), 'size_bytes': stat.size, 'count': stat.count}
+            for stat in snapshot.statistics('lineno')[:limit]
+        ]
+    }
+
+class SlowTraceStore:
+    """保存耗时最长的N次请求的追踪结果，多个worker进程共享"""
+
+    def __init__(self, path, keep=50):
+        self.path = path
+        self.keep = keep
+        self._init_db()
+
+    def _conn(self):
+        return get_connection(self.path)
+
+    def _init_db(self):
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS slow_traces (
+                id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                duration REAL NOT NULL,
+                created REAL NOT NULL,
+                data TEXT NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_slow_traces_duration ON slow_traces (duration)")
+
+    def record(self, trace):
+        """耗时进入前N名时保存，返回是否保存"""
+        try:
+            conn = self._conn()
+            count, fastest = conn.execute("SELECT COUNT(*), MIN(duration) FROM slow_traces").fetchone()
+            if count >= self.keep and trace.duration <= fastest:
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO slow_traces (id, name, duration, created, data) VALUES (?, ?, ?, ?, ?)",
+                (trace.id, trace.root.name, trace.duration, trace.created,
+                 json.dumps(trace.to_dict(), ensure_ascii=False))
+            )
+            conn.execute("""
+                DELETE FROM slow_traces WHERE id IN (
+                    SELECT id FROM slow_traces ORDER BY duration DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.keep,))
+            return True
+        except Exception as e:
+            logger.warning(f"保存追踪结果失败: {str(e)}")
+            return False
+
+    def slowest(self, limit=20):
+        """按耗时从长到短返回追踪摘要"""
+        rows = self._conn().execute(
+            "SELECT id, name, duration, created FROM slow_traces ORDER BY duration DESC LIMIT ?", (limit,)
+        ).fetchall()
+        return [
+            {'id': row[0], 'name': row[1], 'duration_ms': round(row[2] * 1000, 2), 'created': row[3]}
+            for row in rows
+        ]
+
+    def get(self, trace_id):
+        row = self._conn().execute("SELECT data FROM slow_traces WHERE id = ?", (trace_id,)).fetchone()
+        return json.loads(row[0]) if row else None
@@ -0,0 +1,48 @@
+import re
+
+# 分级结果
+SKIP = 'skip'    # 不需要检查，直接记为无错别字
+CHEAP = 'cheap'  # 内容简单，可用更便宜的模型检查
+FULL = 'full'    # 正常检查
+
+_CJK_RE = re.compile(r'[一-鿿]')
+# 不含任何文字（汉字、字母、数字）的片段
+_NO_WORD_RE = re.compile(r'^[\W_]+$')
+# 数字、日期、时间、金额、百分比、编号等（可带少量单位和分隔符）
+_NUMERIC_RE = re.compile(r'^[\d\s\-+/:.,，、。%％()（）年月日号时分秒元第页共]+$')
+# 页码：“第3页 共12页”、“3/12”、“- 3 -”、“Page 3 of 12”
+_PAGE_RE = re.compile(r'^(?:第\s*\d+\s*页\s*[，,/]?\s*(?:共\s*\d+\s*页)?|-?\s*\d+\s*-?|\d+\s*/\s*\d+|page\s*\d+(?:\s*of\s*\d+)?)[。.]?$', re.IGNORECASE)
+_URL_RE = re.compile(r'^(?:https?://|www\.)\S+$', re.IGNORECASE)
+_EMAIL_RE = re.compile(r'^[\w.+-]+@[\w-]+(?:\.[\w-]+)+[。.]?$')
+# 不含空格的字母数字编码，如 ABC-123、SN20250517
+_CODE_RE = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_\-./#]*[。.]?$')
+_TRAILING_PUNCT_RE = re.compile(r'[\W_]+$')
+
+def classify(sentence, min_chars=2, cheap_chars=8):
+    """对句子做本地分级，返回 (分级, 原因)
+
+    min_chars: 汉字数不超过该值的纯汉字短语（如单个词的标题）跳过
+    cheap_chars: 汉字数不超过该值，或汉字占比很低的句子归为简单句
+    """
+    text = sentence.strip()
+    if not text or _NO_WORD_RE.match(text):
+        return SKIP, '仅含标点符号'
+    if _PAGE_RE.match(text):
+        return SKIP, '页码'
+    if _NUMERIC_RE.match(text):
+        return SKIP, '数字或日期'
+    if _URL_RE.match(text):
+        return SKIP, '网址'
+    if _EMAIL_RE.match(text):
+        return SKIP, '邮箱地址'
+    if _CODE_RE.match(text):
+        return SKIP, '字母数字编码'
+    
+    cjk_count = len(_CJK_RE.findall(text))
+    body = _TRAILING_PUNCT_RE.sub('', text)
+    if cjk_count <= min_chars and cjk_count == len(body):
+        return SKIP, '单个词语'
+    
+    if cjk_count <= cheap_chars or cjk_count < len(text) * 0.3:
+        return CHEAP, '短句或汉字占比低'
+    return FULL, ''
@@ -0,0 +1,267 @@
+import hashlib
+import os
+import time
+import uuid
+import logging
+import threading
+
+from db import get_connection
+
+logger = logging.getLogger(__name__)
+
+class UploadStore:
+    """按内容哈希存放上传图片，相同内容只保存一份，多个worker进程共享
+
+    文件保存为 <folder>/<哈希前两位>/<哈希><扩展名>，每次上传增加一次引用，
+    删除时减少引用，引用归零后删除文件。超过 ttl 未被访问的文件和超出
+    quota 的最久未访问文件由后台清理任务删除
+
+    数据库中的路径统一为规范化的绝对路径，调用方传入的路径无论分隔符、大小写
+    （Windows）或相对/绝对形式如何都能对应到同一条记录
+    """
+
+    def __init__(self, folder, db_path, ttl=7 * 24 * 3600, quota=2 * 1024 ** 3):
+        self.folder = folder
+        self.db_path = db_path
+        self.ttl = ttl  # 文件最后一次访问后的保留时间（秒）
+        self.quota = quota  # 上传目录的总字节数上限
+        os.makedirs(os.path.join(folder, 'tmp'), exist_ok=True)
+        self._init_db()
+
+    def _conn(self):
+        return get_connection(self.db_path)
+
+    def _init_db(self):
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS uploads (
+                sha256 TEXT PRIMARY KEY,
+                path TEXT NOT NULL UNIQUE,
+                size INTEGER NOT NULL,
+                refs INTEGER NOT NULL DEFAULT 0,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_uploads_accessed ON uploads (accessed)")
+        # 旧版本按原样保存的路径改为规范化路径
+        for image_hash, path in conn.execute("SELECT sha256, path FROM uploads").fetchall():
+            if _normalize(path) != path:
+                conn.execute("UPDATE uploads SET path = ? WHERE sha256 = ?", (_normalize(path), image_hash))
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sweeps (
+                name TEXT PRIMARY KEY,
+                last_run REAL NOT NULL
+            )
+        """)
+
+    def put(self, stream, ext, head=b'', chunk_size=64 * 1024, max_bytes=None):
+        """保存数据流，返回 (哈希, 文件路径)
+
+        先写入临时文件并计算哈希，内容已存在时丢弃临时文件并增加引用；
+        超过 max_bytes 时删除临时文件并抛出ValueError
+        """
+        temp_path = os.path.join(self.folder, 'tmp', uuid.uuid4().hex)
+        sha256 = hashlib.sha256(head)
+        size = len(head)
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(head)
+                for chunk in iter(lambda: stream.read(chunk_size), b''):
+                    size += len(chunk)
+                    if max_bytes is not None and size > max_bytes:
+                        raise ValueError("文件过大")
+                    sha256.update(chunk)
+                    f.write(chunk)
+            image_hash = sha256.hexdigest()
+            path = os.path.join(self.folder, image_hash[:2], image_hash + ext.lower())
+
+            now = time.time()
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT path FROM uploads WHERE sha256 = ?", (image_hash,)).fetchone()
+                if row is not None and os.path.exists(row[0]):
+                    path = self._relative(row[0])
+                    conn.execute(
+                        "UPDATE uploads SET refs = refs + 1, accessed = ? WHERE sha256 = ?", (now, image_hash)
+                    )
+                else:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    os.replace(temp_path, path)
+                    conn.execute(
+                        "INSERT OR REPLACE INTO uploads (sha256, path, size, refs, created, accessed) "
+                        "VALUES (?, ?, ?, 1, ?, ?)",
+                        (image_hash, _normalize(path), size, now, now)
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            return image_hash, path
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def hash_of(self, path):
+        """存储中文件的内容哈希，不在存储中时返回None"""
+        row = self._conn().execute("SELECT sha256 FROM uploads WHERE path = ?", (_normalize(path),)).fetchone()
+        return row[0] if row else None
+
+    def touch(self, path):
+        """记录一次访问，推迟过期清理"""
+        self._conn().execute("UPDATE uploads SET accessed = ? WHERE path = ?", (time.time(), _normalize(path)))
+
+    def release(self, path):
+        """减少一次引用，引用归零时删除文件；返回文件是否被删除
+
+        不在存储中、直接保存在上传目录下的文件（旧版本保存的文件）直接删除；
+        哈希子目录中没有记录的文件不删除，以免绕过引用计数
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT sha256, refs FROM uploads WHERE path = ?", (_normalize(path),)).fetchone()
+            if row is not None and row[1] > 1:
+                conn.execute("UPDATE uploads SET refs = refs - 1 WHERE sha256 = ?", (row[0],))
+                conn.execute("COMMIT")
+                return False
+            if row is None and _normalize(os.path.dirname(path)) != _normalize(self.folder):
+                logger.warning(f"文件不在上传存储中，不删除: {path}")
+                conn.execute("COMMIT")
+                return False
+            if row is not None:
+                conn.execute("DELETE FROM uploads WHERE sha256 = ?", (row[0],))
+            # 在事务内删除文件，避免删掉其他进程刚保存的同一内容
+            _remove_file(path)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return True
+
+    def claim_sweep(self, name, interval):
+        """多个worker中只让一个在每个周期内执行清理，返回是否由当前进程执行"""
+        now = time.time()
+        cursor = self._conn().execute("""
+            INSERT INTO sweeps (name, last_run) VALUES (?, ?)
+            ON CONFLICT (name) DO UPDATE SET last_run = excluded.last_run WHERE last_run < ?
+        """, (name, now, now - interval))
+        return cursor.rowcount > 0
+
+    def sweep(self):
+        """删除过期文件，并按最近访问时间删除超出配额的文件，返回删除的文件数"""
+        conn = self._conn()
+        removed = 0
+        if self.ttl:
+            expired = conn.execute(
+                "SELECT sha256, path, accessed FROM uploads WHERE accessed < ?", (time.time() - self.ttl,)
+            ).fetchall()
+            removed += self._delete(expired)
+
+        if self.quota:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM uploads").fetchone()[0]
+            if total > self.quota:
+                victims = []
+                for image_hash, path, accessed, size in conn.execute(
+                    "SELECT sha256, path, accessed, size FROM uploads ORDER BY accessed"
+                ):
+                    if total <= self.quota:
+                        break
+                    victims.append((image_hash, path, accessed))
+                    total -= size
+                removed += self._delete(victims)
+
+        # 旧版本直接保存在上传目录下的文件，以及中断留下的临时文件
+        removed += purge_expired_files(self.folder, self.ttl)
+        removed += purge_expired_files(os.path.join(self.folder, 'tmp'), 3600)
+        if removed:
+            logger.info(f"上传目录清理: 删除 {removed} 个文件")
+        return removed
+
+    def _delete(self, entries):
+        """删除 (哈希, 路径, 访问时间) 列表中的文件，期间又被访问过的文件保留"""
+        conn = self._conn()
+        removed = 0
+        for image_hash, path, accessed in entries:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = conn.execute(
+                    "DELETE FROM uploads WHERE sha256 = ? AND accessed = ?", (image_hash, accessed)
+                )
+                if cursor.rowcount:
+                    _remove_file(path)
+                    removed += 1
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return removed
+
+    def _relative(self, stored_path):
+        """把数据库中的规范化路径转换为与新保存的文件相同的 <folder>/... 形式"""
+        root = _normalize(self.folder)
+        return os.path.join(self.folder, os.path.relpath(stored_path, root))
+
+    def stats(self):
+        files, size, refs = self._conn().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(refs), 0) FROM uploads"
+        ).fetchone()
+        return {'files': files, 'bytes': size, 'refs': refs, 'quota': self.quota}
+
+def purge_expired_files(folder, ttl):
+    """删除目录下（不含子目录）修改时间早于ttl秒前的文件，返回删除的文件数"""
+    if not ttl or not os.path.isdir(folder):
+        return 0
+    expired = time.time() - ttl
+    removed = 0
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            try:
+                if entry.is_file() and entry.stat().st_mtime < expired:
+                    os.remove(entry.path)
+                    removed += 1
+            except OSError as e:
+                logger.warning(f"删除过期文件失败: {entry.path}, {str(e)}")
+    return removed
+
+def _normalize(path):
+    return os.path.normcase(os.path.abspath(path))
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"删除文件失败: {path}, {str(e)}")
+
+class Sweeper:
+    """后台定期执行清理任务，每个进程在首次使用时启动一个线程"""
+
+    def __init__(self, store, interval, tasks):
+        self.store = store
+        self.interval = interval
+        self.tasks = tasks  # 清理函数列表
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            self._pid = pid
+            threading.Thread(target=self._loop, name='storage-sweeper', daemon=True).start()
+
+    def _loop(self):
+        while True:
+            try:
+                if self.store.claim_sweep('storage', self.interval):
+                    for task in self.tasks:
+                        task()
+            except Exception as e:
+                logger.error(f"存储清理失败: {str(e)}")
+            time.sleep(self.interval)
@@ -1,7 +1,8 @@
 import json
 import os
 from PyQt5.QtCore import QThread, pyqtSignal
-import requests
+import http_client
+from segmenter import split_sentences
 import base64
 import mimetypes
 import re
@@ -46,17 +47,8 @@ class ProcessWorker(QThread):
 
                 self.log.emit(f"OCR识别结果: {text_content}")
                 
-                # 按句号分割文本，确保每句话都有结尾标点
-                sentences = []
-                current_sentence = ""
-                for char in text_content:
-                    current_sentence += char
-                    if char in ['。', '！', '？', '…', '.', '!', '?']:
-                        if current_sentence.strip():
-                            sentences.append(current_sentence.strip())
-                        current_sentence = ""
-                if current_sentence.strip():  # 添加最后一句（如果没有结尾标点）
-                    sentences.append(current_sentence.strip())
+                # 按句末标点分句
+                sentences = [span.text for span in split_sentences(text_content)]
                 
                 total_sentences = len(sentences)
                 processed_sentences = []
@@ -226,7 +218,7 @@ class ProcessWorker(QThread):
             with open(abs_path, "rb") as f:
                 url ='http://172.16.2.122:8064/agent-sales/gpt/fileOcrText'
                 files = {"file": (abs_path, f)}
-                response = requests.post(url=url, files=files)
+                response = http_client.post(url, files=files)
 
             # 打印响应信息
             self.log.emit("\n==================== OCR API 响应信息 ====================")
@@ -302,7 +294,7 @@ class ProcessWorker(QThread):
             
             self.log.emit(f"正在检查文本: {text}")
             
-            response = requests.post(
+            response = http_client.post(
                 self.config['api2_url'],
                 headers=headers,
                 json=data